@@ -0,0 +1,5 @@
+"""Standalone benchmarks, run as ``python -m benchmarks.<name>``.
+
+Each benchmark works on its own throwaway SQLite database, never on
+``db.sqlite3``.
+"""
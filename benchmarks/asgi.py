@@ -0,0 +1,144 @@
+"""Concurrent-connection throughput of the WSGI and ASGI entry points.
+
+    python -m benchmarks.asgi [--clients 64] [--requests 512] [--workers 4]
+                              [--client-delay-ms 0 200] [--output FILE]
+
+Both applications are driven in-process with the same number of Django
+worker threads. Every client reads its response slowly
+(``--client-delay-ms``, like a mobile connection): under WSGI a worker
+thread blocks while the response is written out, the way threaded WSGI
+servers behave, while under ASGI the event loop waits for the client
+and the worker is already serving the next request. With a zero delay
+the two should be level, which checks that the adapter itself costs
+little.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import generate, setup_django
+from .views import Driver
+
+
+def urls():
+    from django.urls import reverse
+    from posts.models import Group, Post, User
+
+    # A typical post, not the one that drew hundreds of comments.
+    post = Post.objects.filter(comment_count__lte=5).order_by('-pk').first()
+    author = User.objects.order_by('-stats__posts_count').first()
+    group = Group.objects.first()
+    return [
+        reverse('index'),
+        reverse('group_posts', args=[group.slug]),
+        reverse('profile', args=[author.username]),
+        reverse('post', args=[post.author.username, post.pk]),
+    ]
+
+
+def run_wsgi(application, paths, clients, workers, delay):
+    driver = Driver(application, '')
+    driver.cookie = ''
+
+    def request(path):
+        status = driver.request('GET', path)
+        # The thread stays busy writing to the slow client.
+        time.sleep(delay)
+        return status
+
+    # Each client is an open connection; the server has ``workers`` threads.
+    with ThreadPoolExecutor(min(clients, workers)) as pool:
+        return list(pool.map(request, paths))
+
+
+def run_asgi(application, paths, clients, delay):
+    async def client(queue, statuses):
+        while queue:
+            path = queue.pop()
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'',
+                'headers': [(b'host', b'testserver')], 'http_version': '1.1',
+                'scheme': 'http', 'server': ('testserver', 80),
+            }
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.append(message['status'])
+                elif not message.get('more_body'):
+                    await asyncio.sleep(delay)
+
+            await application(scope, receive, send)
+
+    async def main():
+        queue, statuses = list(reversed(paths)), []
+        await asyncio.gather(*(client(queue, statuses) for _ in range(clients)))
+        return statuses
+
+    return asyncio.run(main())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='reuse an already generated database')
+    parser.add_argument('--clients', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=512)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--client-delay-ms', type=float, nargs='+', default=[0, 200])
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args(argv)
+
+    setup_django(args.db)
+    if args.db is None:
+        generate(users=300, posts=5000, comments=10000)
+
+    from django.conf import settings
+    settings.DEBUG = False
+    settings.METRICS_SAMPLE_RATE = 0
+    settings.METRICS_SLOW_REQUEST_MS = float('inf')
+    settings.ASGI_WORKERS = args.workers
+    from yatube.asgi import WsgiToAsgi
+    from yatube.wsgi import application as wsgi_application
+    asgi_application = WsgiToAsgi(wsgi_application, args.workers)
+
+    paths = list(itertools.islice(itertools.cycle(urls()), args.requests))
+    report = []
+    for delay_ms in args.client_delay_ms:
+        delay = delay_ms / 1000
+        for name, run in (
+                ('wsgi', lambda: run_wsgi(
+                    wsgi_application, paths, args.clients, args.workers, delay)),
+                ('asgi', lambda: run_asgi(
+                    asgi_application, paths, args.clients, delay))):
+            start = time.perf_counter()
+            statuses = run()
+            elapsed = time.perf_counter() - start
+            report.append({
+                'server': name,
+                'client_delay_ms': delay_ms,
+                'clients': args.clients,
+                'workers': args.workers,
+                'requests': len(statuses),
+                'errors': sum(status != 200 for status in statuses),
+                'requests_per_second': round(len(statuses) / elapsed, 1),
+            })
+            print(f'{name}  delay {delay_ms:5.0f} ms  {len(statuses) / elapsed:8.1f} req/s  '
+                  f'errors {report[-1]["errors"]}', file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
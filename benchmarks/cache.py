@@ -0,0 +1,128 @@
+"""Cache backends compared: LocMemCache, FileBasedCache and SQLiteCache.
+
+    python -m benchmarks.cache [--keys 2000] [--value-bytes 20000]
+                               [--processes 4] [--output FILE]
+
+Reports, per backend:
+
+* single-process latency of ``get`` (hit and miss), ``set``, ``incr``
+  and ``get_many`` of ten keys, in microseconds;
+* the page-cache hit rate when ``--processes`` workers each read every
+  key once and fill in the misses, which is what a shared cache buys:
+  with a per-process cache every worker pays for its own misses;
+* how many of the workers' concurrent increments of one counter
+  survive (``incr`` in FileBasedCache is a read-modify-write).
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from .common import timed
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'yatube.sqlite_cache.SQLiteCache',
+}
+INCREMENTS = 500
+
+
+def make_cache(name, location, keys):
+    from django.utils.module_loading import import_string
+    backend = import_string(BACKENDS[name])
+    # Room for every key, so the numbers measure access rather than culling.
+    params = {'TIMEOUT': None, 'OPTIONS': {'MAX_ENTRIES': keys * 2, 'MAX_BYTES': 2 ** 40}}
+    return backend(os.path.join(location, name) if name != 'locmem' else name, params)
+
+
+def latencies(cache, keys, value):
+    for number in range(keys):
+        cache.set(f'key{number}', value)
+    cache.set('counter', 0)
+    counter = iter(range(10 ** 9))
+
+    def micro(func, repeat=2000):
+        return round(timed(lambda: [func() for _ in range(100)], repeat // 100) * 10, 1)
+
+    return {
+        'get_hit_us': micro(lambda: cache.get(f'key{next(counter) % keys}')),
+        'get_miss_us': micro(lambda: cache.get('missing')),
+        'set_us': micro(lambda: cache.set(f'key{next(counter) % keys}', value)),
+        'incr_us': micro(lambda: cache.incr('counter')),
+        'get_many_10_us': micro(lambda: cache.get_many(
+            [f'key{(next(counter) + n) % keys}' for n in range(10)])),
+    }
+
+
+def worker(name, location, keys, value, results):
+    cache = make_cache(name, location, keys)
+    hits = 0
+    for number in range(keys):
+        if cache.get(f'page{number}') is not None:
+            hits += 1
+        else:
+            cache.set(f'page{number}', value)
+    for _ in range(INCREMENTS):
+        cache.incr('shared_counter')
+    results.put(hits)
+
+
+def shared(name, location, keys, value, processes):
+    context = multiprocessing.get_context('fork')
+    cache = make_cache(name, location, keys)
+    cache.set('shared_counter', 0)
+    results = context.Queue()
+    workers = [context.Process(target=worker, args=(name, location, keys, value, results))
+               for _ in range(processes)]
+    for process in workers:
+        process.start()
+    hits = sum(results.get() for _ in workers)
+    for process in workers:
+        process.join()
+    return {
+        'hit_rate': round(hits / (keys * processes), 3),
+        # LocMemCache: every process counts on its own copy.
+        'increments_kept': round((make_cache(name, location, keys).get('shared_counter') or 0)
+                                 / (INCREMENTS * processes), 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, default=2000)
+    parser.add_argument('--value-bytes', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    value = os.urandom(args.value_bytes)
+    report = []
+    for name in BACKENDS:
+        location = tempfile.mkdtemp(prefix='yatube-cache-')
+        try:
+            row = {'backend': name}
+            row.update(latencies(make_cache(name, location, args.keys), args.keys, value))
+            shutil.rmtree(location)
+            os.makedirs(location)
+            row.update(shared(name, location, args.keys, value, args.processes))
+        finally:
+            shutil.rmtree(location, ignore_errors=True)
+        report.append(row)
+        print('  '.join(f'{key} {value}' for key, value in row.items()), file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def setup_django(db_path=None):
+    """Configure Django against a scratch database and migrate it.
+
+    Returns the database path; a new temporary file is used unless one is
+    given, so an already seeded dataset can be reused between runs.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    from django.conf import settings
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='yatube-bench-'), 'db.sqlite3')
+    settings.DATABASES['default']['NAME'] = db_path
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command('migrate', verbosity=0)
+    return db_path
+
+
+def generate(**sizes):
+    """Fill the scratch database through ``manage.py generate_data``."""
+    from django.core.management import call_command
+    options = [f'--{name.replace("_", "-")}={value}' for name, value in sizes.items()]
+    call_command('generate_data', *options, stdout=sys.stderr)
+
+
+def timed(func, repeat=20):
+    """Run ``func`` ``repeat`` times and return the median in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
@@ -0,0 +1,81 @@
+"""EXPLAIN QUERY PLAN and timings for every feed and lookup query.
+
+    python -m benchmarks.query_plans [--posts N] [--db PATH]
+
+Seeds a large dataset, prints the SQLite plan and median latency of each
+hot query and exits non-zero if any of them scans ``posts_post`` or
+sorts through a temporary B-tree instead of walking an index.
+"""
+import argparse
+import re
+import sys
+
+from .common import generate, setup_django, timed
+
+BAD_PLAN = re.compile(
+    r'^SCAN (TABLE )?posts_\w+( AS \w+)?$|USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+
+
+def explain(queryset):
+    from django.db import connection
+    sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def hot_queries():
+    from posts import timeline
+    from posts.models import Follow, Post, User
+    from posts.paginator import older_than
+
+    per_page = 11
+    ordering = ('-pub_date', '-pk')
+    deep = Post.objects.order_by(*ordering).values_list('pub_date', 'pk')[
+        Post.objects.count() // 2]
+    author = Post.objects.values_list('author', flat=True).order_by('-pk').first()
+    group = Post.objects.exclude(group=None).values_list('group', flat=True).first()
+    reader = Follow.objects.values_list('user', flat=True).first()
+    post = Post.objects.order_by('-comment_count').first()
+    feed = Post.objects.for_feed()
+    inbox = timeline.follow_feed(User(pk=reader))[0]
+    return {
+        'index, first page': feed.order_by(*ordering)[:per_page],
+        'index, deep page': feed.filter(older_than(('pub_date', 'pk'), *deep))
+                                .order_by(*ordering)[:per_page],
+        'profile': feed.filter(author=author).order_by(*ordering)[:per_page],
+        'profile, deep page': feed.filter(author=author)
+                                  .filter(older_than(('pub_date', 'pk'), *deep))
+                                  .order_by(*ordering)[:per_page],
+        'group': feed.filter(group=group).order_by(*ordering)[:per_page],
+        'follow feed': inbox.order_by('-feed_date', '-feed_post')[:per_page],
+        'comments of a post': post.comments.all(),
+        'followers of an author': Follow.objects.filter(author=author).values('user'),
+        'is following': Follow.objects.filter(user=reader, author=author),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--db', help='reuse an already seeded database')
+    args = parser.parse_args(argv)
+
+    setup_django(args.db)
+    if args.db is None:
+        generate(posts=args.posts, comments=args.posts * 2)
+
+    failures = 0
+    for name, queryset in hot_queries().items():
+        plan = explain(queryset)
+        ms = timed(lambda: list(queryset.all()))
+        bad = [step for step in plan if BAD_PLAN.search(step)]
+        failures += bool(bad)
+        print(f'{name}: {ms:.2f} ms{"  <-- NO INDEX" if bad else ""}')
+        for step in plan:
+            print(f'    {step}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
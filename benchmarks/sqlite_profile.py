@@ -0,0 +1,168 @@
+"""Mixed read/write throughput of the development and production SQLite profiles.
+
+    python -m benchmarks.sqlite_profile [--processes 4] [--threads 4]
+                                        [--seconds 10] [--write-share 0.2]
+                                        [--output FILE]
+
+Like a pre-forking server, ``--processes`` worker processes each run
+``--threads`` logged-in clients against ``yatube.wsgi.application``.
+A client posts a comment with probability ``--write-share`` and
+otherwise reads a post, profile or group page. Each profile starts from
+its own copy of the same generated database and is selected the way a
+deployment selects it, through ``YATUBE_DB_PROFILE``. Failed requests
+are mostly "database is locked" errors.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+
+from .common import generate, setup_django
+from .views import Driver, percentile
+
+PROFILES = ('development', 'production')
+
+
+def plan():
+    from django.urls import reverse
+    from posts.models import Group, Post, User
+
+    posts = list(Post.objects.filter(comment_count__lte=5).select_related('author')[:200])
+    authors = User.objects.order_by('-stats__posts_count')[:50]
+    reads = [reverse('post', args=[post.author.username, post.pk]) for post in posts]
+    reads += [reverse('profile', args=[author.username]) for author in authors]
+    reads += [reverse('group_posts', args=[group.slug]) for group in Group.objects.all()[:20]]
+    writes = [reverse('add_comment', args=[post.author.username, post.pk]) for post in posts]
+    return reads, writes
+
+
+def sessions(count):
+    from django.conf import settings
+    from django.test import Client
+    from posts.models import User
+
+    cookies = []
+    for user in User.objects.order_by('pk')[:count]:
+        client = Client()
+        client.force_login(user)
+        cookies.append(client.cookies[settings.SESSION_COOKIE_NAME].value)
+    return cookies
+
+
+def worker(profile, db_path, cookies, reads, writes, seconds, write_share, results):
+    os.environ['YATUBE_DB_PROFILE'] = profile
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = db_path
+    import django
+    django.setup()
+    settings.DEBUG = False
+    settings.METRICS_SAMPLE_RATE = 0
+    settings.METRICS_SLOW_REQUEST_MS = float('inf')
+    logging.getLogger('django.request').setLevel(logging.CRITICAL)
+    from yatube.wsgi import application
+
+    samples = {'read': [], 'write': []}
+    errors = []
+    deadline = time.monotonic() + seconds
+
+    def client(cookie):
+        driver = Driver(application, cookie)
+        while time.monotonic() < deadline:
+            kind = 'write' if random.random() < write_share else 'read'
+            start = time.perf_counter()
+            if kind == 'write':
+                status = driver.request('POST', random.choice(writes), {'text': 'Нагрузка'})
+            else:
+                status = driver.request('GET', random.choice(reads))
+            if status >= 500:
+                errors.append(kind)
+            else:
+                samples[kind].append((time.perf_counter() - start) * 1000)
+
+    threads = [threading.Thread(target=client, args=(cookie,)) for cookie in cookies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((samples, errors))
+
+
+def run(profile, db_path, args, cookies, reads, writes):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [
+        context.Process(target=worker, args=(
+            profile, db_path, cookies[number::args.processes], reads, writes,
+            args.seconds, args.write_share, results))
+        for number in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    samples, errors = {'read': [], 'write': []}, []
+    for _ in processes:
+        part, failed = results.get()
+        for kind in samples:
+            samples[kind] += part[kind]
+        errors += failed
+    for process in processes:
+        process.join()
+
+    row = {
+        'profile': profile,
+        'clients': len(cookies),
+        'requests_per_second': round(
+            (len(samples['read']) + len(samples['write'])) / args.seconds, 1),
+        'errors': len(errors),
+        'failed_writes': errors.count('write'),
+    }
+    for kind, values in samples.items():
+        row[f'{kind}s'] = len(values)
+        row[f'{kind}_p50_ms'] = round(percentile(values, 0.50), 2) if values else None
+        row[f'{kind}_p95_ms'] = round(percentile(values, 0.95), 2) if values else None
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-share', type=float, default=0.2)
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args(argv)
+
+    db_path = setup_django()
+    generate(users=300, posts=5000, comments=10000)
+    reads, writes = plan()
+    cookies = sessions(args.processes * args.threads)
+    from django.db import connection
+    connection.close()
+
+    report = []
+    for profile in PROFILES:
+        copy = f'{db_path}.{profile}'
+        shutil.copy(db_path, copy)
+        row = run(profile, copy, args, cookies, reads, writes)
+        report.append(row)
+        print(f"{profile:12} {row['requests_per_second']:8.1f} req/s  "
+              f"errors {row['errors']:5}  read p95 {row['read_p95_ms']} ms  "
+              f"write p95 {row['write_p95_ms']} ms", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
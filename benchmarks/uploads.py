@@ -0,0 +1,147 @@
+"""Peak memory and latency of one image upload to /new/.
+
+    python -m benchmarks.uploads [--photo-size 4000x3000] [--output FILE]
+
+Each upload is sent through ``yatube.wsgi.application`` in a forked child,
+once with Django's stock upload handlers and once with
+``IMAGE_UPLOAD_HANDLERS`` from settings, so one run cannot inflate the next
+one's numbers. Peak memory is the growth of the child's resident set
+(``VmHWM`` after resetting it through ``/proc/self/clear_refs``), which
+unlike tracemalloc also sees Pillow's buffers; Linux only.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+from .common import setup_django
+from .views import Driver
+
+DJANGO_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+
+def payloads(photo_size, max_bytes):
+    """``(name, filename, bytes)`` for every kind of upload measured."""
+    from PIL import Image
+
+    # Sensor-like noise keeps the JPEG about as large as a phone photo.
+    shape = Image.effect_mandelbrot(photo_size, (-2, -1.2, 1, 1.2), 64)
+    noise = Image.effect_noise(photo_size, 24)
+    photo = Image.merge('RGB', (shape, noise, shape))
+    plain, rotated = BytesIO(), BytesIO()
+    photo.save(plain, 'JPEG', quality=95)
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    photo.save(rotated, 'JPEG', quality=95, exif=exif.tobytes())
+    # Compresses to a few hundred KB but decodes to 144 megapixels.
+    bomb = BytesIO()
+    Image.new('1', (12000, 12000)).save(bomb, 'PNG')
+    return [
+        ('photo', 'photo.jpg', plain.getvalue()),
+        ('photo with EXIF', 'rotated.jpg', rotated.getvalue()),
+        ('oversized', 'huge.jpg', plain.getvalue() * (max_bytes // len(plain.getvalue()) + 2)),
+        ('pixel bomb', 'bomb.png', bomb.getvalue()),
+    ]
+
+
+def peak_rss_kib():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith(('VmHWM', 'VmRSS')):
+                yield int(line.split()[1])
+
+
+def measure(driver, filename, content, handlers):
+    """Upload in a forked child; return ``(status, ms, peak KiB)``."""
+    from django.conf import settings
+    from django.db import connections
+    from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+
+    body = encode_multipart(BOUNDARY, {'text': 'Фото', 'image': _named(filename, content)})
+    connections.close_all()
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        settings.FILE_UPLOAD_HANDLERS = settings.IMAGE_UPLOAD_HANDLERS = handlers
+        with open('/proc/self/clear_refs', 'w') as refs:
+            refs.write('5')
+        _, baseline = peak_rss_kib()
+        start = time.perf_counter()
+        status = driver.request('POST', '/new/', body, MULTIPART_CONTENT)
+        elapsed = (time.perf_counter() - start) * 1000
+        peak, _ = peak_rss_kib()
+        os.write(write_fd, json.dumps([status, elapsed, peak - baseline]).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        result = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+    return result
+
+
+def _named(filename, content):
+    file = BytesIO(content)
+    file.name = filename
+    return file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--photo-size', default='4000x3000')
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.conf import settings
+    from django.contrib.auth.models import User
+    from django.test import Client
+    from posts import images
+    from yatube.wsgi import application
+
+    settings.DEBUG = False
+    settings.METRICS_SLOW_REQUEST_MS = float('inf')
+    # Only the upload itself is measured, not the thumbnails it queues.
+    images.schedule = lambda post: None
+    settings.MEDIA_ROOT = tempfile.mkdtemp(prefix='yatube-media-')
+    settings.FILE_UPLOAD_TEMP_DIR = os.path.join(settings.MEDIA_ROOT, 'tmp')
+    os.makedirs(settings.FILE_UPLOAD_TEMP_DIR)
+    user = User.objects.create_user('uploader')
+    client = Client()
+    client.force_login(user)
+    driver = Driver(application, client.cookies[settings.SESSION_COOKIE_NAME].value)
+
+    width, height = map(int, args.photo_size.split('x'))
+    report = []
+    for name, filename, content in payloads((width, height), settings.IMAGE_UPLOAD_MAX_BYTES):
+        for label, handlers in (('django', DJANGO_HANDLERS),
+                                ('streaming', settings.IMAGE_UPLOAD_HANDLERS)):
+            status, elapsed, peak = measure(driver, filename, content, handlers)
+            report.append({
+                'payload': name,
+                'bytes': len(content),
+                'handlers': label,
+                'status': status,
+                'ms': round(elapsed, 1),
+                'peak_rss_kib': peak,
+            })
+            print(f'{name:16} {len(content) / 2 ** 20:7.1f} MB  {label:9}  {status}  '
+                  f'{elapsed:8.1f} ms  peak {peak / 1024:8.1f} MB', file=sys.stderr)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
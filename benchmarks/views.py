@@ -0,0 +1,207 @@
+"""End-to-end latency, query count and memory for every view in posts/urls.py.
+
+    python -m benchmarks.views [--db PATH] [--requests N] [--cold] [--output FILE]
+
+Requests go through ``yatube.wsgi.application`` exactly as a WSGI server
+would send them. Latency percentiles come from a plain timed pass; query
+counts and the peak of memory allocated while serving one request come
+from a separate instrumented pass, so tracing does not skew the timings.
+The JSON report is written to ``--output`` (stdout by default) and can be
+compared between runs.
+"""
+import argparse
+import io
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+from wsgiref.util import setup_testing_defaults
+
+from .common import generate, setup_django
+
+CSRF_TOKEN = 'b' * 32
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Driver:
+    """Calls the WSGI application directly with hand-built environs."""
+
+    def __init__(self, application, session_cookie):
+        self.application = application
+        self.cookie = f'sessionid={session_cookie}; csrftoken={CSRF_TOKEN}'
+
+    def request(self, method, path, data=None,
+                content_type='application/x-www-form-urlencoded'):
+        """Send ``data`` as a form, or as is if it is already ``bytes``."""
+        body = data if isinstance(data, bytes) else urlencode(data or {}).encode()
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path.split('?')[0],
+            'QUERY_STRING': path.partition('?')[2],
+            'HTTP_COOKIE': self.cookie,
+            'HTTP_X_CSRFTOKEN': CSRF_TOKEN,
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+        }
+        setup_testing_defaults(environ)
+        status = []
+        result = self.application(environ, lambda code, headers: status.append(code))
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return int(status[0].split()[0])
+
+
+def scenarios():
+    """One (name, method, path, data) entry per URL pattern in posts/urls.py."""
+    from django.urls import reverse
+    from posts.models import Follow, Group, Post, User
+    from posts.views import comment_page
+
+    reader = Follow.objects.values_list('user', flat=True).first()
+    reader = User.objects.get(pk=reader)
+    author = User.objects.exclude(pk=reader.pk).exclude(
+        following__user=reader).order_by('-stats__posts_count').first()
+    post = Post.objects.order_by('-comment_count').first()
+    # Post edits are only allowed to the author, so edit one of the reader's.
+    own = Post.objects.filter(author=reader).first()
+    if own is None:
+        own = Post.objects.create(text='Пост для бенчмарка', author=reader)
+    group = Group.objects.order_by('-pk').first()
+    post_kwargs = {'username': post.author.username, 'post_id': post.pk}
+    own_kwargs = {'username': reader.username, 'post_id': own.pk}
+    # "More comments" asks for the page after the one the post page shows.
+    _, cursor = comment_page(post)
+    more_comments = reverse('post_comments', kwargs=post_kwargs)
+    if cursor:
+        more_comments += '?' + urlencode({'cursor': cursor})
+    return reader, [
+        ('index', 'GET', reverse('index'), None),
+        ('follow_index', 'GET', reverse('follow_index'), None),
+        ('popular', 'GET', reverse('popular'), None),
+        ('group_directory', 'GET', reverse('group_directory'), None),
+        ('group_posts', 'GET', reverse('group_posts', args=[group.slug]), None),
+        ('new_post GET', 'GET', reverse('new_post'), None),
+        ('new_post POST', 'POST', reverse('new_post'), {'text': 'Новый пост'}),
+        ('search', 'GET', reverse('search') + '?' + urlencode({'q': 'кофе'}), None),
+        ('profile', 'GET', reverse('profile', args=[author.username]), None),
+        ('post', 'GET', reverse('post', kwargs=post_kwargs), None),
+        ('post_comments', 'GET', more_comments, None),
+        ('add_comment', 'POST', reverse('add_comment', kwargs=post_kwargs),
+         {'text': 'Комментарий'}),
+        ('post_edit GET', 'GET', reverse('post_edit', kwargs=own_kwargs), None),
+        ('post_edit POST', 'POST', reverse('post_edit', kwargs=own_kwargs),
+         {'text': 'Отредактированный пост'}),
+        ('profile_follow', 'GET', reverse('profile_follow', args=[author.username]), None),
+        ('profile_unfollow', 'GET', reverse('profile_unfollow', args=[author.username]), None),
+        ('export_posts', 'GET', reverse('export_posts', args=[reader.username]), None),
+        ('api_index', 'GET', reverse('api_index'), None),
+        ('api_follow_index', 'GET', reverse('api_follow_index'), None),
+        ('api_group_posts', 'GET', reverse('api_group_posts', args=[group.slug]), None),
+        ('api_profile', 'GET', reverse('api_profile', args=[author.username]), None),
+        ('api_post', 'GET', reverse('api_post', kwargs=post_kwargs), None),
+    ]
+
+
+def run(driver, plan, requests, cold):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = {name: [] for name, *_ in plan}
+    statuses = {}
+    for _ in range(requests):
+        for name, method, path, data in plan:
+            if cold:
+                cache.clear()
+            start = time.perf_counter()
+            statuses[name] = driver.request(method, path, data)
+            timings[name].append((time.perf_counter() - start) * 1000)
+
+    report = {}
+    tracemalloc.start()
+    for name, method, path, data in plan:
+        if cold:
+            cache.clear()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        with CaptureQueriesContext(connection) as queries:
+            driver.request(method, path, data)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        samples = timings[name]
+        report[name] = {
+            'method': method,
+            'path': path,
+            'status': statuses[name],
+            'p50_ms': round(percentile(samples, 0.50), 3),
+            'p95_ms': round(percentile(samples, 0.95), 3),
+            'p99_ms': round(percentile(samples, 0.99), 3),
+            'mean_ms': round(statistics.mean(samples), 3),
+            'queries': len(queries),
+            'peak_alloc_kib': round(peak / 1024, 1),
+        }
+    tracemalloc.stop()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='reuse an already generated database')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=50,
+                        help='timed requests per view')
+    parser.add_argument('--cold', action='store_true',
+                        help='clear the cache before every request')
+    parser.add_argument('--output', help='write the JSON report here')
+    args = parser.parse_args(argv)
+
+    db_path = setup_django(args.db)
+    if args.db is None:
+        generate(users=args.users, posts=args.posts, comments=args.posts * 2)
+
+    from django.conf import settings
+    from django.test import Client
+    from yatube.wsgi import application
+
+    settings.DEBUG = False
+    reader, plan = scenarios()
+    client = Client()
+    client.force_login(reader)
+    driver = Driver(application, client.cookies[settings.SESSION_COOKIE_NAME].value)
+    views = run(driver, plan, args.requests, args.cold)
+
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(),
+        'database': db_path,
+        'requests_per_view': args.requests,
+        'cold_cache': args.cold,
+        'views': views,
+    }
+    for name, row in views.items():
+        print(f"{name:18} {row['status']}  p50 {row['p50_ms']:8.2f}  "
+              f"p95 {row['p95_ms']:8.2f}  p99 {row['p99_ms']:8.2f} ms  "
+              f"{row['queries']:3} queries  {row['peak_alloc_kib']:8.1f} KiB",
+              file=sys.stderr)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""Read-only JSON mirror of the feeds for the mobile client.
+
+Every endpoint answers conditional GETs. The ETag is built from the
+content generation (bumped on every post, comment and group change,
+see ``cache.py``) and the newest ``pub_date`` of the feed, both of
+which cost one indexed lookup; a profile adds the author's counters,
+which change on follows too, and a post its ``views.post_state``.
+``condition`` compares it with ``If-None-Match`` before the view runs,
+so an unchanged poll gets a 304 without any feed query or
+serialisation.
+"""
+from django.db.models import Count, Max
+from django.http import JsonResponse
+from django.views.decorators.http import condition, require_GET
+from django.views.decorators.vary import vary_on_cookie
+
+from . import images, timeline
+from .cache import get_generation
+from .models import Follow, Group, Post, User
+from .paginator import CursorPaginator
+from .views import POSTS_PER_PAGE, comment_page, make_etag, post_state, stats_state
+
+COMPACT = {'separators': (',', ':'), 'ensure_ascii': False}
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params=COMPACT)
+
+
+def not_found():
+    return json_response({'detail': 'not found'}, status=404)
+
+
+def newest(posts):
+    return posts.order_by('-pub_date').values_list('pub_date', flat=True).first()
+
+
+def serialize_post(post):
+    return {
+        'id': post.pk,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'text': post.text,
+        'pub_date': post.pub_date.isoformat(),
+        'comment_count': post.comment_count,
+        'image': images.card_image(post) if post.image else None,
+    }
+
+
+def feed_response(request, post_list, keys=('pub_date', 'pk'), **extra):
+    page = CursorPaginator(post_list, POSTS_PER_PAGE, keys).get_page(
+        request.GET.get('cursor'))
+    return json_response({
+        **extra,
+        'results': [serialize_post(post) for post in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def index_etag(request):
+    return make_etag(request, get_generation(), newest(Post.objects.all()))
+
+
+def group_etag(request, slug):
+    return make_etag(
+        request, get_generation(), slug, newest(Post.objects.filter(group__slug=slug)))
+
+
+def profile_etag(request, username):
+    user_id = User.objects.filter(username=username).values_list('pk', flat=True).first()
+    if user_id is None:
+        return None
+    return make_etag(request, get_generation(), user_id, stats_state(user_id),
+                     newest(Post.objects.filter(author_id=user_id)))
+
+
+def post_etag(request, username, post_id):
+    state = post_state(request, username, post_id)
+    if state is None:
+        return None
+    return make_etag(request, get_generation(), state)
+
+
+def follow_etag(request):
+    if not request.user.is_authenticated:
+        return None
+    # Following or unfollowing someone changes the count or the newest id.
+    follows = Follow.objects.filter(user=request.user).aggregate(
+        count=Count('pk'), last=Max('pk'))
+    newest_entry = request.user.timeline.order_by('-pub_date').values_list(
+        'pub_date', flat=True).first()
+    return make_etag(request, get_generation(), follows['count'], follows['last'],
+                     newest_entry)
+
+
+@require_GET
+@condition(etag_func=index_etag)
+def index(request):
+    return feed_response(request, Post.objects.for_feed())
+
+
+@require_GET
+@condition(etag_func=group_etag)
+def group_posts(request, slug):
+    group = Group.objects.filter(slug=slug).first()
+    if group is None:
+        return not_found()
+    return feed_response(
+        request, group.group_posts.for_feed(),
+        group={'slug': group.slug, 'title': group.title, 'description': group.description})
+
+
+@require_GET
+@condition(etag_func=profile_etag)
+def profile(request, username):
+    author = User.objects.filter(username=username).select_related('stats').first()
+    if author is None:
+        return not_found()
+    stats = getattr(author, 'stats', None)
+    return feed_response(request, author.author_posts.for_feed(), profile={
+        'username': author.username,
+        'full_name': author.get_full_name(),
+        'posts_count': stats.posts_count if stats else 0,
+        'followers_count': stats.followers_count if stats else 0,
+        'following_count': stats.following_count if stats else 0,
+    })
+
+
+@require_GET
+@condition(etag_func=post_etag)
+def post_view(request, username, post_id):
+    post = Post.objects.for_feed().filter(pk=post_id, author__username=username).first()
+    if post is None:
+        return not_found()
+    comments, next_cursor = comment_page(post, request.GET.get('cursor'))
+    return json_response({
+        **serialize_post(post),
+        'comments': [
+            {'id': comment.pk, 'author': comment.author.username,
+             'text': comment.text, 'created': comment.created.isoformat()}
+            for comment in comments
+        ],
+        'comments_next': next_cursor,
+    })
+
+
+@require_GET
+@vary_on_cookie
+@condition(etag_func=follow_etag)
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return json_response({'detail': 'authentication required'}, status=401)
+    return feed_response(
+        request, timeline.follow_feed(request.user), timeline.FEED_KEYS)
@@ -0,0 +1,33 @@
+"""Helpers for commands that write rows in bulk, past the model signals.
+
+``generate_data`` and ``import_jsonl`` insert with raw SQL or
+``bulk_create``, so neither the signals nor the ORM tell them the new
+ids, and the derived tables are rebuilt once at the end instead of row
+by row.
+"""
+from django.db import connection
+
+from . import counters, hot, search, timeline
+
+
+def last_id(model):
+    """The largest id SQLite has handed out for ``model``.
+
+    Tables are ``AUTOINCREMENT``, so ids of deleted rows are never reused
+    and ``max(pk) + 1`` is not necessarily the next id.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s',
+                       [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def rebuild_derived():
+    """Recompute what the model signals would have maintained."""
+    counters.recount()
+    timeline.rebuild()
+    search.rebuild()
+    hot.rebuild()
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
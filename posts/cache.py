@@ -0,0 +1,241 @@
+"""Whole-page caching invalidated by content events.
+
+Cached pages are stored under a key prefix that embeds a *generation*
+number. Saving or deleting a post, comment or group bumps the generation
+(see ``signals.py``), which moves every page to fresh keys at once, so
+the TTL only bounds memory use and can be long without serving stale
+content. Hits and misses for ``cache_stats`` are tallied in the process
+and added to totals in the cache every ``CACHE_STATS_FLUSH_INTERVAL``
+seconds, so counting costs no cache write per request.
+
+A bump also sends every visitor to an empty key at the same moment, and
+so does a TTL running out. To keep them from all rebuilding the page at
+once, a rebuild is single-flight:
+
+* the worker that wins a short lock in the cache (``cache.add``) runs
+  the view, the others serve the previous copy meanwhile: the expired
+  entry, which is kept ``CACHE_STALE_TIMEOUT`` past its TTL, or the page
+  of the previous generation, found through a generation-free pointer;
+* if there is no previous copy at all, they wait for the winner for up
+  to ``CACHE_LOCK_TIMEOUT`` rather than run the view themselves;
+* entries are rebuilt a little before they expire, with a probability
+  that grows as expiry nears and with the time the last rebuild took
+  ("XFetch", Vattani et al., *Optimal Probabilistic Cache Stampede
+  Prevention*), so a busy page is usually refreshed by one request
+  before anyone sees it expire.
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter, namedtuple
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_cache_key, has_vary_header, learn_cache_key
+
+from yatube import metrics, routers
+
+GENERATION_KEY = 'feed_generation'
+STATS_KEY = 'page_cache_stats:{}'
+# Larger values rebuild earlier; 1 is the value the XFetch paper suggests.
+EARLY_EXPIRY_BETA = 1.0
+LOCK_POLL_INTERVAL = 0.05
+
+# What is stored: the value, when it expires and how long it took to build.
+Entry = namedtuple('Entry', 'value expires delta')
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Start from the clock rather than 1, so an evicted counter can
+        # never roll back onto keys that still hold older pages.
+        cache.add(GENERATION_KEY, int(time.time() * 1000), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_generation():
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        get_generation()
+
+
+_pending = Counter()
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def count(event):
+    metrics.incr(f'cache_{event}')
+    with _pending_lock:
+        _pending[event] += 1
+        due = time.monotonic() - _last_flush >= settings.CACHE_STATS_FLUSH_INTERVAL
+    if due:
+        flush_stats()
+
+
+def flush_stats():
+    """Add the counts of this process to the totals in the cache."""
+    global _pending, _last_flush
+    with _pending_lock:
+        pending, _pending = _pending, Counter()
+        _last_flush = time.monotonic()
+    for event, number in pending.items():
+        key = STATS_KEY.format(event)
+        if not cache.add(key, number, None):
+            cache.incr(key, number)
+
+
+def cache_stats():
+    """Totals so far; other processes' counts may lag by a flush interval."""
+    flush_stats()
+    return {event: cache.get(STATS_KEY.format(event), 0)
+            for event in ('hits', 'misses', 'stale')}
+
+
+def is_fresh(entry):
+    """Whether ``entry`` can be served without an early rebuild."""
+    if not isinstance(entry, Entry):
+        return False
+    # -log(u) is exponentially distributed: usually small, now and then
+    # large enough to pull the rebuild ahead of the expiry time.
+    early = -entry.delta * EARLY_EXPIRY_BETA * math.log(1 - random.random())
+    return time.time() + early < entry.expires
+
+
+def store(key, value, timeout, delta):
+    cache.set(key, Entry(value, time.time() + timeout, delta),
+              timeout + settings.CACHE_STALE_TIMEOUT)
+
+
+def timed_build(build):
+    """Call ``build`` and return its value with the seconds it took.
+
+    It reads from the primary: the value is cached under the current
+    generation, which a lagging replica may not have caught up with.
+    """
+    start = time.perf_counter()
+    with routers.primary():
+        value = build()
+    return value, time.perf_counter() - start
+
+
+def single_flight(name, stale, build, lookup):
+    """Run ``build()`` in one worker at a time.
+
+    The others return ``stale.value`` if there is a stale entry, or
+    else wait for ``lookup()`` to find the entry the winner stores.
+    """
+    lock = f'{name}:lock'
+    if cache.add(lock, 1, settings.CACHE_LOCK_TIMEOUT):
+        try:
+            return build()
+        finally:
+            cache.delete(lock)
+    if stale is not None:
+        count('stale')
+        return stale.value
+    deadline = time.monotonic() + settings.CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        # Check the lock first: once it is gone the entry is stored.
+        released = cache.get(lock) is None
+        entry = lookup()
+        if isinstance(entry, Entry):
+            return entry.value
+        if released:
+            break
+    # The winner failed or gave up on caching: build it ourselves.
+    return build()
+
+
+def get_or_build(key, build, timeout):
+    """Cached ``build()`` under ``key``, rebuilt by one worker at a time.
+
+    For fragments that are keyed on the generation, like the pages
+    below: the copy of the previous generation is served while the new
+    one is built.
+    """
+    latest_key = f'{key}:latest'
+    key = f'{key}:{get_generation()}'
+    entry = cache.get(key)
+    if is_fresh(entry):
+        count('hits')
+        return entry.value
+    count('misses')
+
+    def rebuild():
+        value, delta = timed_build(build)
+        store(key, value, timeout, delta)
+        cache.set(latest_key, key, timeout + settings.CACHE_STALE_TIMEOUT)
+        return value
+
+    stale = entry if isinstance(entry, Entry) else previous(latest_key)
+    return single_flight(latest_key, stale, rebuild, lambda: cache.get(key))
+
+
+def previous(latest_key):
+    """The entry the generation-free pointer ``latest_key`` leads to."""
+    key = cache.get(latest_key) if latest_key else None
+    entry = cache.get(key) if key else None
+    return entry if isinstance(entry, Entry) else None
+
+
+def is_cacheable(request, response):
+    if response.streaming or response.status_code != 200:
+        return False
+    if 'private' in response.get('Cache-Control', ()):
+        return False
+    # Same rule as UpdateCacheMiddleware: a response that starts a new
+    # session must not be replayed to other visitors.
+    if not request.COOKIES and response.cookies and has_vary_header(response, 'Cookie'):
+        return False
+    return True
+
+
+def cache_page_versioned(timeout, key_prefix):
+    """Like ``cache_page``, but keyed on the current content generation."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            prefix = f'{key_prefix}.{get_generation()}'
+            latest_prefix = f'{key_prefix}.latest'
+            ttl = timeout + settings.CACHE_STALE_TIMEOUT
+
+            def lookup():
+                key = get_cache_key(request, prefix, 'GET', cache=cache)
+                return cache.get(key) if key else None
+
+            entry = lookup()
+            if is_fresh(entry):
+                count('hits')
+                return entry.value
+            count('misses')
+
+            def rebuild():
+                response, delta = timed_build(lambda: view(request, *args, **kwargs))
+                if is_cacheable(request, response):
+                    key = learn_cache_key(request, response, ttl, prefix, cache=cache)
+                    store(key, response, timeout, delta)
+                    latest = learn_cache_key(request, response, ttl, latest_prefix, cache=cache)
+                    cache.set(latest, key, ttl)
+                return response
+
+            # The pointer is only known once the page has been cached
+            # for this URL and these Vary headers; until then the Vary
+            # headers are unknown too, so the first build locks the URL.
+            latest = get_cache_key(request, latest_prefix, 'GET', cache=cache)
+            if latest is None:
+                url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+                return single_flight(f'{key_prefix}.first.{url}', None, rebuild, lookup)
+            stale = entry if isinstance(entry, Entry) else previous(latest)
+            return single_flight(latest, stale, rebuild, lookup)
+        return wrapper
+    return decorator
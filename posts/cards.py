@@ -0,0 +1,40 @@
+"""Fragment cache for rendered post cards.
+
+A card is cached under a key built from the post id and everything that
+can change its markup: the last edit time, the comment counter and
+whether the viewer is the author (who gets an edit link). Editing the
+post or commenting on it therefore moves the card to a new key and the
+stale fragment simply ages out. Feeds fetch all their cards with a
+single ``get_many`` and render only the misses.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from yatube import metrics
+
+
+def card_key(post, user):
+    is_author = int(user is not None and user.pk == post.author_id)
+    version = f'{post.updated.timestamp()}.{post.comment_count}.{is_author}'
+    return f'post_card:{post.pk}:{version}'
+
+
+def render_cards(posts, user):
+    posts = list(posts)
+    keys = [card_key(post, user) for post in posts]
+    cached = cache.get_many(keys)
+    rendered, missing = [], {}
+    for post, key in zip(posts, keys):
+        card = cached.get(key)
+        if card is None:
+            card = render_to_string(
+                'includes/post_item.html', {'post': post, 'user': user})
+            missing[key] = card
+        rendered.append(card)
+    metrics.incr('cache_hits', len(cached))
+    metrics.incr('cache_misses', len(missing))
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+    return mark_safe(''.join(rendered))
@@ -0,0 +1,61 @@
+"""Denormalised counters for posts, comments and follows.
+
+``Post.comment_count`` and the ``UserStats`` row of each user are bumped
+from model signals inside the writing transaction, so pages read a
+single row instead of counting. ``recount`` rebuilds everything from the
+source tables and is what ``manage.py recount_counters`` runs.
+"""
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def stats_for(user):
+    """Return the user's counters, or an unsaved all-zero row."""
+    return UserStats.objects.filter(user=user).first() or UserStats(user=user)
+
+
+def bump_user(user_id, field, delta):
+    users = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        users = users.filter(**{f'{field}__gte': -delta})
+    if users.update(**{field: F(field) + delta}) or delta < 0:
+        # Nothing to create on a decrement: a missing row there means a
+        # cascade is deleting the user as well.
+        return
+    stats, created = UserStats.objects.get_or_create(
+        user_id=user_id, defaults={field: delta})
+    if not created:
+        users.update(**{field: F(field) + delta})
+
+
+def bump_post(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comment_count__gte=-delta)
+    posts.update(comment_count=F('comment_count') + delta)
+
+
+def _count(model, field, outer='pk'):
+    counts = (model.objects.filter(**{field: OuterRef(outer)}).order_by()
+              .values(field).annotate(total=Count('pk')).values('total'))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+@transaction.atomic
+def recount():
+    """Recompute every counter from scratch to repair drift."""
+    Post.objects.update(comment_count=_count(Comment, 'post'))
+    missing = User.objects.filter(stats__isnull=True).values_list('pk', flat=True)
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in missing.iterator()],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    UserStats.objects.update(
+        posts_count=_count(Post, 'author', 'user'),
+        followers_count=_count(Follow, 'author', 'user'),
+        following_count=_count(Follow, 'user', 'user'),
+    )
@@ -0,0 +1,73 @@
+"""Streaming export of an author's posts with their comments.
+
+Posts and comments are read with two server-side iterators, both ordered
+by post id, and merged as they go, so memory stays flat no matter how
+much the author has written. Each post record is followed by the
+records of its comments. The JSONL output uses the same record format
+``import_jsonl`` reads.
+"""
+import csv
+import json
+
+from .models import Comment, Post
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+CSV_COLUMNS = ['type', 'id', 'post', 'author', 'group', 'text', 'date', 'image']
+
+
+def records(author):
+    """Yield the post and comment records of ``author``, post by post."""
+    posts = Post.objects.filter(author=author).order_by('pk').values_list(
+        'pk', 'text', 'pub_date', 'updated', 'group__slug', 'image')
+    comments = Comment.objects.filter(post__author=author).order_by('post_id', 'pk').values_list(
+        'pk', 'post', 'author__username', 'text', 'created')
+    comments = comments.iterator(chunk_size=CHUNK_SIZE)
+    comment = next(comments, None)
+    for pk, text, pub_date, updated, group, image in posts.iterator(chunk_size=CHUNK_SIZE):
+        record = {
+            'type': 'post', 'id': pk, 'author': author.username, 'text': text,
+            'pub_date': pub_date.isoformat(), 'updated': updated.isoformat(),
+        }
+        if group:
+            record['group'] = group
+        if image:
+            record['image'] = image
+        yield record
+        while comment is not None and comment[1] == pk:
+            comment_pk, post, username, text, created = comment
+            yield {
+                'type': 'comment', 'id': comment_pk, 'post': post,
+                'author': username, 'text': text, 'created': created.isoformat(),
+            }
+            comment = next(comments, None)
+
+
+def jsonl_lines(author):
+    for record in records(author):
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+class _Line:
+    """File-like object whose ``write`` hands the CSV line back."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(author):
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for record in records(author):
+        yield writer.writerow([
+            record['type'], record['id'], record.get('post', ''), record['author'],
+            record.get('group', ''), record['text'],
+            record.get('pub_date') or record['created'], record.get('image', ''),
+        ])
+
+
+def lines(author, export_format):
+    return jsonl_lines(author) if export_format == 'jsonl' else csv_lines(author)
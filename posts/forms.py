@@ -1,7 +1,11 @@
 from django.db import models
 from .models import Post, Group, Comment
 from django import forms
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
 
+from .uploads import OversizedUpload, normalize_image
 
 
 class PostForm(forms.ModelForm):
@@ -16,7 +20,36 @@ class PostForm(forms.ModelForm):
             "group": "Сообщества",
             "image": "Картинки"
         }
-        
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The upload handler already dropped these; report them in clean().
+        self.oversized = [
+            name for name, upload in self.files.items()
+            if isinstance(upload, OversizedUpload)
+        ]
+        if self.oversized:
+            self.files = self.files.copy()
+            for name in self.oversized:
+                del self.files[name]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        limit = filesizeformat(settings.IMAGE_UPLOAD_MAX_BYTES)
+        for name in self.oversized:
+            self.add_error(name, f"Файл больше {limit}.")
+        return cleaned_data
+
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not isinstance(image, UploadedFile):
+            return image
+        width, height = image.image.size
+        if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            raise forms.ValidationError(
+                f"Слишком большое изображение: {width}×{height} точек.")
+        return normalize_image(image)
+
 
 class CommentForm(forms.ModelForm):
     text = forms.CharField(widget=forms.Textarea)
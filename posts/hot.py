@@ -0,0 +1,104 @@
+"""Popular posts: comment activity with exponential time decay.
+
+A post's heat is the sum over its comments of ``exp(-λ·age)``, so a
+comment counts half as much every ``HOT_HALF_LIFE`` seconds. Ages keep
+changing, but each term can be measured from a fixed ``EPOCH`` instead:
+``exp(λ·(created - EPOCH))`` scaled down by the same ``exp(λ·(now -
+EPOCH))`` for every post. The ranking never changes with the clock, so
+the stored score only moves when a comment arrives. Those terms grow
+without bound, so ``HotPost.score`` keeps their natural log, and a new
+comment is added with ``logaddexp`` in a single ``UPDATE``.
+
+What does change with time is how much of the table is still worth
+keeping. ``compact`` (``manage.py update_hot_posts``, run periodically)
+drops posts whose decayed heat fell below ``HOT_MIN_SCORE`` and trims the
+rest to ``HOT_POSTS_LIMIT``, so the ``/popular/`` feed stays a short
+indexed read of a small table.
+"""
+import math
+from datetime import datetime, timedelta, timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+from django.utils import timezone as django_timezone
+
+from .models import Comment, HotPost
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+# Older comments add less than 0.1% of a fresh one.
+HORIZON_HALF_LIVES = 10
+
+
+def decay_rate():
+    return math.log(2) / settings.HOT_HALF_LIFE
+
+
+def log_weight(when, weight=1.0):
+    """The log of a comment's term, measured at ``EPOCH``."""
+    return math.log(weight) + decay_rate() * (when - EPOCH).total_seconds()
+
+
+def heat(score, now=None):
+    """A stored score as decayed comment weight at ``now``."""
+    now = now or django_timezone.now()
+    return math.exp(score - log_weight(now))
+
+
+def logaddexp(score, value):
+    # log(e^a + e^b) = max(a, b) + log(1 + e^-|a - b|), which cannot overflow.
+    return Greatest(score, value) + Ln(
+        Value(1.0) + Exp(Abs(score - value) * -1, output_field=FloatField()),
+        output_field=FloatField())
+
+
+def record_comment(post_id, created):
+    value = log_weight(created)
+    posts = HotPost.objects.filter(post_id=post_id)
+    if posts.update(score=logaddexp(F('score'), Value(value, output_field=FloatField()))):
+        return
+    _, is_new = HotPost.objects.get_or_create(post_id=post_id, defaults={'score': value})
+    if not is_new:
+        posts.update(score=logaddexp(F('score'), Value(value, output_field=FloatField())))
+
+
+def compact(now=None, hot_posts=HotPost):
+    """Drop cooled-down posts and trim to the limit; return rows deleted."""
+    now = now or django_timezone.now()
+    threshold = math.log(settings.HOT_MIN_SCORE) + log_weight(now)
+    deleted, _ = hot_posts.objects.filter(score__lt=threshold).delete()
+    # Trim by rank in the feed's (score, post) order, so a tie at the
+    # cutoff keeps the posts ranked above it instead of dropping them all.
+    last = hot_posts.objects.order_by('-score', '-post_id').values_list(
+        'score', 'post_id')[settings.HOT_POSTS_LIMIT - 1:settings.HOT_POSTS_LIMIT]
+    last = next(iter(last), None)
+    if last is not None:
+        score, post_id = last
+        trimmed, _ = hot_posts.objects.filter(
+            Q(score__lt=score) | Q(score=score, post_id__lt=post_id)).delete()
+        deleted += trimmed
+    return deleted
+
+
+@transaction.atomic
+def rebuild(now=None, comments=Comment, hot_posts=HotPost):
+    """Recompute every score from the recent comments.
+
+    The models can be swapped for the historical ones of a migration.
+    """
+    now = now or django_timezone.now()
+    since = now - timedelta(seconds=settings.HOT_HALF_LIFE * HORIZON_HALF_LIVES)
+    scores = {}
+    rows = comments.objects.filter(created__gte=since).order_by().values_list(
+        'post_id', 'created')
+    for post_id, created in rows.iterator(chunk_size=2000):
+        value = log_weight(created)
+        score = scores.get(post_id)
+        scores[post_id] = value if score is None else (
+            max(score, value) + math.log1p(math.exp(-abs(score - value))))
+    hot_posts.objects.all().delete()
+    hot_posts.objects.bulk_create(
+        [hot_posts(post_id=post_id, score=score) for post_id, score in scores.items()],
+        batch_size=500)
+    compact(now, hot_posts)
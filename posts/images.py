@@ -0,0 +1,145 @@
+"""Responsive image variants generated off the request path.
+
+Resizing an upload used to happen in ``{% thumbnail %}`` while the first
+viewer waited, and concurrent first views resized the same image twice.
+Now ``schedule`` queues the work on a small thread pool once the post is
+committed. The worker renders the card crop at every width in
+``CARD_WIDTHS``, once as WebP and once in the upload's own format, and
+stores their URLs, dimensions and byte sizes in ``Post.image_variants``.
+``card_image`` turns that into ``srcset``/``sizes`` for the template
+without touching storage, so phones download a small WebP instead of
+the full-width JPEG. Until the worker is done the card shows the
+original upload.
+"""
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+from sorl.thumbnail import get_thumbnail
+
+from .cache import bump_generation
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# The card keeps the 960x339 crop it has always had, at several widths.
+CARD_RATIO = 339 / 960
+CARD_WIDTHS = (320, 480, 720, 960)
+# Rendered card width at each Bootstrap breakpoint.
+CARD_SIZES = ('(min-width: 1200px) 1110px, (min-width: 992px) 930px, '
+              '(min-width: 768px) 690px, 100vw')
+# Formats a fallback variant may keep; anything else becomes JPEG.
+FALLBACK_FORMATS = {'JPEG', 'PNG'}
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            settings.IMAGE_WORKERS, thread_name_prefix='thumbnails')
+    return _executor
+
+
+def fallback_format(image):
+    image.open()
+    try:
+        with Image.open(image) as source:
+            source_format = source.format
+    finally:
+        image.close()
+    return source_format if source_format in FALLBACK_FORMATS else 'JPEG'
+
+
+def render_variants(image):
+    """Render the card crop of ``image`` in every width and format."""
+    formats = {}
+    for image_format in ('WEBP', fallback_format(image)):
+        variants = []
+        for width in CARD_WIDTHS:
+            geometry = f'{width}x{round(width * CARD_RATIO)}'
+            thumbnail = get_thumbnail(
+                image, geometry, crop='center', upscale=True, format=image_format)
+            variants.append({
+                'url': thumbnail.url,
+                'width': thumbnail.width,
+                'height': thumbnail.height,
+                'bytes': thumbnail.storage.size(thumbnail.name),
+            })
+        formats[image_format.lower()] = variants
+    return {'card': formats}
+
+
+def card_image(post):
+    """Attributes for the card ``<img>``, read from the stored variants."""
+    formats = post.variants.get('card')
+    if not isinstance(formats, dict):
+        # Not rendered yet, or rendered before there were several widths.
+        return {'src': post.image.url}
+    fallback = next(
+        (variants for name, variants in formats.items() if name != 'webp' and variants), None)
+    if fallback is None:
+        # Browsers without WebP need a variant they can show.
+        return {'src': post.image.url}
+    largest = fallback[-1]
+    return {
+        'src': largest['url'],
+        'width': largest['width'],
+        'height': largest['height'],
+        'sizes': CARD_SIZES,
+        'srcset': srcset(fallback),
+        'webp_srcset': srcset(formats.get('webp', [])),
+    }
+
+
+def srcset(variants):
+    return ', '.join(f"{variant['url']} {variant['width']}w" for variant in variants)
+
+
+def generate(post_id, name):
+    """Render the variants of one post image and store them on the post.
+
+    Returns whether the post was updated. Nothing is stored if the file
+    is missing or the post has switched to another image meanwhile.
+    """
+    post = Post.objects.filter(pk=post_id, image=name).first()
+    if post is None or not post.image.storage.exists(name):
+        return False
+    try:
+        variants = render_variants(post.image)
+    except (OSError, SyntaxError):
+        # PIL reports truncated and broken files as either of these.
+        logger.exception('Could not render variants of %s', name)
+        return False
+    # ``updated`` moves the cached card to a new key.
+    updated = Post.objects.filter(pk=post_id, image=name).update(
+        image_variants=json.dumps(variants), updated=timezone.now())
+    if updated:
+        bump_generation()
+    return bool(updated)
+
+
+def _run(post_id, name):
+    close_old_connections()
+    try:
+        generate(post_id, name)
+    except Exception:
+        logger.exception('Thumbnail job for post %s failed', post_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """Queue variant generation for ``post`` after the current commit."""
+    if not post.image:
+        return
+    post_id, name = post.pk, post.image.name
+    if not settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: generate(post_id, name))
+    else:
+        transaction.on_commit(lambda: executor().submit(_run, post_id, name))
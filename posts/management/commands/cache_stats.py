@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.cache import cache_stats, get_generation
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша страниц'
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total if total else 0
+        self.stdout.write(f"Поколение: {get_generation()}")
+        self.stdout.write(f"Попадания: {stats['hits']}")
+        self.stdout.write(f"Промахи: {stats['misses']}")
+        self.stdout.write(f"Доля попаданий: {ratio:.1%}")
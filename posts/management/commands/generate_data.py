@@ -0,0 +1,143 @@
+import random
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from posts.bulk import last_id, rebuild_derived
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими данными: пользователи, группы, '
+            'посты с неравномерной популярностью авторов, комментарии и '
+            'подписки со степенным распределением')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='среднее число подписок на пользователя')
+        parser.add_argument('--days', type=int, default=365,
+                            help='за сколько дней распределить посты')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='показатель закона Ципфа для популярности авторов')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+        now = timezone.now()
+        with transaction.atomic():
+            first_user = self.insert_users(options['users'], now)
+            users = range(first_user, first_user + options['users'])
+            # Author popularity follows Zipf's law: the k-th most popular
+            # author is picked about 1 / k**skew as often as the first.
+            popularity = list(accumulate(
+                1 / rank ** options['skew'] for rank in range(1, len(users) + 1)))
+            first_group = self.insert_groups(options['groups'])
+            groups = range(first_group, first_group + options['groups'])
+            period = timedelta(days=options['days'])
+            first_post = self.insert_posts(
+                options['posts'], users, popularity, groups, now, period)
+            self.insert_comments(
+                options['comments'], first_post, options['posts'], users, now, period)
+            self.insert_follows(users, popularity, options['follows'])
+            rebuild_derived()
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def insert(self, model, columns, rows):
+        table = model._meta.db_table
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            table, ', '.join(columns), ', '.join(['%s'] * len(columns)))
+        # Stored the way the ORM stores them, or keyset lookups would
+        # compare differently formatted dates as text.
+        adapt = connection.ops.adapt_datetimefield_value
+        batch = []
+        inserted = 0
+        with connection.cursor() as cursor:
+            for row in rows:
+                batch.append([adapt(value) if isinstance(value, datetime) else value
+                              for value in row])
+                if len(batch) == self.batch_size:
+                    cursor.executemany(sql, batch)
+                    inserted += len(batch)
+                    batch = []
+            if batch:
+                cursor.executemany(sql, batch)
+                inserted += len(batch)
+        # The transaction holds the write lock, so the new ids are consecutive.
+        return last_id(model) - inserted + 1
+
+    def insert_users(self, count, now):
+        offset = User.objects.count()
+        return self.insert(
+            User,
+            ['password', 'is_superuser', 'username', 'first_name', 'last_name',
+             'email', 'is_staff', 'is_active', 'date_joined'],
+            (('!', False, f'user{offset + i}', '', '', '', False, True, now)
+             for i in range(count)))
+
+    def insert_groups(self, count):
+        offset = Group.objects.count()
+        return self.insert(
+            Group, ['title', 'slug', 'description'],
+            ((f'Группа {offset + i}', f'group-{offset + i}', 'Сгенерированная группа')
+             for i in range(count)))
+
+    def insert_posts(self, count, users, popularity, groups, now, period):
+        rnd = self.rnd
+        step = period / max(count, 1)
+        authors = rnd.choices(users, cum_weights=popularity, k=count)
+        words = ['кот', 'пёс', 'утро', 'кофе', 'город', 'лето', 'книга',
+                 'дорога', 'море', 'снег', 'музыка', 'работа']
+
+        def rows():
+            for i, author in enumerate(authors):
+                pub_date = now - period + step * i
+                text = ' '.join(rnd.choices(words, k=rnd.randint(3, 40)))
+                group = rnd.choice(groups) if groups and rnd.random() < 0.6 else None
+                yield text, pub_date, pub_date, author, group, '', 0, ''
+
+        return self.insert(
+            Post,
+            ['text', 'pub_date', 'updated', 'author_id', 'group_id', 'image',
+             'comment_count', 'image_variants'],
+            rows())
+
+    def insert_comments(self, count, first_post, posts, users, now, period):
+        rnd = self.rnd
+        if not posts:
+            return
+        step = period / posts
+
+        def rows():
+            for _ in range(count):
+                # Newer posts draw most of the discussion.
+                offset = min(int(posts * (1 - rnd.random() ** 3)), posts - 1)
+                # Same date as in insert_posts; the comment comes some time after.
+                pub_date = now - period + step * offset
+                yield (first_post + offset, rnd.choice(users),
+                       'Сгенерированный комментарий', pub_date + (now - pub_date) * rnd.random())
+
+        self.insert(Comment, ['post_id', 'author_id', 'text', 'created'], rows())
+
+    def insert_follows(self, users, popularity, average):
+        rnd = self.rnd
+        pairs = set()
+        for user in users:
+            # Out-degree is Pareto distributed around ``average``;
+            # targets are chosen by popularity, so in-degree is skewed too.
+            wanted = min(int(rnd.paretovariate(2) * average / 2), len(users) - 1)
+            for author in rnd.choices(users, cum_weights=popularity, k=wanted):
+                if author != user:
+                    pairs.add((user, author))
+        self.insert(Follow, ['user_id', 'author_id'], sorted(pairs))
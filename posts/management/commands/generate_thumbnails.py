@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from posts import images
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры для уже загруженных картинок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='пересоздать миниатюры и у готовых постов')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='0 — готовить в текущем потоке')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            posts = posts.filter(image_variants='')
+        jobs = posts.values_list('pk', 'image').iterator()
+
+        def run(job):
+            close_old_connections()
+            try:
+                return images.generate(*job)
+            finally:
+                close_old_connections()
+
+        if options['workers']:
+            with ThreadPoolExecutor(options['workers']) as pool:
+                done = sum(pool.map(run, jobs))
+        else:
+            done = sum(images.generate(*job) for job in jobs)
+        self.stdout.write(self.style.SUCCESS(f'Готово миниатюр: {done}'))
@@ -0,0 +1,243 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from posts.bulk import last_id, rebuild_derived
+from posts.cache import bump_generation
+from posts.models import Comment, Follow, Group, Post, User
+
+
+@contextmanager
+def archive_dates():
+    """Let ``bulk_create`` keep the dates from the archive.
+
+    ``auto_now``/``auto_now_add`` fields overwrite any value on insert, so
+    they are switched off for the duration of the import.
+    """
+    fields = [field for model in (Post, Comment) for field in model._meta.fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = ('Загружает архив постов, комментариев и подписок из JSONL. '
+            'Каждая строка — объект с полем "type": '
+            '{"type": "post", "id", "author", "text", "pub_date", "group"?, "image"?}, '
+            '{"type": "comment", "id", "post", "author", "text", "created"} или '
+            '{"type": "follow", "user", "author"}. Авторы задаются именем, '
+            'группы — slug; недостающие создаются. Посты и комментарии '
+            'получают новые id, соответствие id архива хранится рядом с '
+            'checkpoint. Повторный запуск продолжает с последней сохранённой '
+            'позиции.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='строк в одном INSERT')
+        parser.add_argument('--chunk-size', type=int, default=20000,
+                            help='строк в одной транзакции')
+        parser.add_argument('--checkpoint',
+                            help='файл с позицией в архиве (по умолчанию <path>.checkpoint)')
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help='не пересчитывать счётчики, ленты и поиск в конце')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        checkpoint = options['checkpoint'] or options['path'] + '.checkpoint'
+        ids_path = checkpoint + '.ids'
+        position = self.load_checkpoint(checkpoint, ids_path)
+        self.users, self.groups = {}, {}
+        self.skipped = 0
+        imported, started = 0, time.perf_counter()
+
+        with open(options['path'], 'rb') as archive, open(ids_path, 'ab') as ids, \
+                archive_dates():
+            archive.seek(position['offset'])
+            line_number = position['line']
+            while True:
+                chunk = []
+                for line in archive:
+                    line_number += 1
+                    if line.strip():
+                        chunk.append((line_number, line))
+                    if len(chunk) == options['chunk_size']:
+                        break
+                if not chunk:
+                    break
+                with transaction.atomic():
+                    count, new_ids, probe = self.import_chunk(chunk)
+                    ids.writelines(f'{old} {new}\n'.encode() for old, new in new_ids)
+                    ids.flush()
+                    os.fsync(ids.fileno())
+                    done = {'offset': archive.tell(), 'line': line_number, 'ids': ids.tell()}
+                    # A crash between the commit and the next checkpoint
+                    # would replay the chunk and duplicate its rows: on
+                    # resume, ``probe`` tells whether it was committed.
+                    self.save_checkpoint(checkpoint, dict(position, pending=dict(done, probe=probe)))
+                imported += count
+                position = done
+                self.save_checkpoint(checkpoint, position)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f'Строка {line_number}: загружено {imported}, '
+                    f'{imported / elapsed:.0f} строк/с')
+
+        if not options['no_rebuild']:
+            self.stdout.write('Пересчёт счётчиков, лент и поискового индекса…')
+            rebuild_derived()
+            bump_generation()
+        for path in (checkpoint, ids_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено {imported}, пропущено {self.skipped} '
+            f'за {time.perf_counter() - started:.1f} с'))
+
+    def load_checkpoint(self, path, ids_path):
+        """Return the position to resume from and load the post id mapping."""
+        position = {'offset': 0, 'line': 0, 'ids': 0}
+        if os.path.exists(path):
+            with open(path) as fh:
+                position.update(json.load(fh))
+            pending = position.pop('pending', None)
+            if pending and self.committed(pending.pop('probe')):
+                position = pending
+            self.stdout.write(f"Продолжаю со строки {position['line'] + 1}")
+        # Lines past the checkpoint belong to a chunk that was rolled back.
+        if os.path.exists(ids_path):
+            os.truncate(ids_path, position['ids'])
+            with open(ids_path) as fh:
+                self.post_ids = dict(map(int, line.split()) for line in fh)
+        else:
+            self.post_ids = {}
+        return position
+
+    def committed(self, probe):
+        if probe is None:
+            # Only follows, and replaying those changes nothing.
+            return False
+        kind, pk, text = probe
+        model = {'post': Post, 'comment': Comment}[kind]
+        return model.objects.filter(pk=pk, text=text).exists()
+
+    def save_checkpoint(self, path, position):
+        with open(path + '.tmp', 'w') as fh:
+            json.dump(position, fh)
+        os.replace(path + '.tmp', path)
+
+    def import_chunk(self, chunk):
+        records = {'post': [], 'comment': [], 'follow': []}
+        for line_number, line in chunk:
+            try:
+                record = json.loads(line)
+                records[record['type']].append(record)
+            except (ValueError, KeyError, TypeError):
+                raise CommandError(f'Строка {line_number}: не удалось разобрать запись')
+
+        self.resolve_users(
+            [r['author'] for r in records['post'] + records['comment'] + records['follow']]
+            + [r['user'] for r in records['follow']])
+        self.resolve_groups([r['group'] for r in records['post'] if r.get('group')])
+
+        # Archive ids may already belong to live rows, so posts and
+        # comments get fresh ids; comments find their post via the mapping.
+        posts, archive_ids, seen = [], [], set()
+        for r in records['post']:
+            if r['id'] in self.post_ids or r['id'] in seen:
+                self.skipped += 1
+                continue
+            seen.add(r['id'])
+            archive_ids.append(r['id'])
+            posts.append(Post(
+                text=r['text'], author_id=self.users[r['author']],
+                group_id=self.groups.get(r.get('group')), image=r.get('image') or '',
+                pub_date=self.date(r['pub_date']),
+                updated=self.date(r.get('updated') or r['pub_date'])))
+        self.insert(Post, posts)
+        first = last_id(Post) - len(posts) + 1
+        new_ids = list(zip(archive_ids, range(first, first + len(posts))))
+        self.post_ids.update(new_ids)
+
+        comments = [
+            Comment(post_id=self.post_ids[r['post']], author_id=self.users[r['author']],
+                    text=r['text'], created=self.date(r['created']))
+            for r in records['comment'] if r['post'] in self.post_ids
+        ]
+        self.skipped += len(records['comment']) - len(comments)
+        self.insert(Comment, comments)
+
+        pairs = {(self.users[r['user']], self.users[r['author']])
+                 for r in records['follow'] if r['user'] != r['author']}
+        pairs -= set(Follow.objects.filter(
+            user_id__in={user for user, _ in pairs},
+            author_id__in={author for _, author in pairs},
+        ).values_list('user_id', 'author_id'))
+        follows = [Follow(user_id=user, author_id=author) for user, author in pairs]
+        self.skipped += len(records['follow']) - len(follows)
+        # A follow made on the site meanwhile is not an error.
+        self.insert(Follow, follows, ignore_conflicts=True)
+
+        if posts:
+            probe = ('post', new_ids[-1][1], posts[-1].text)
+        elif comments:
+            probe = ('comment', last_id(Comment), comments[-1].text)
+        else:
+            probe = None
+        return len(posts) + len(comments) + len(follows), new_ids, probe
+
+    def insert(self, model, objects, ignore_conflicts=False):
+        model.objects.bulk_create(
+            objects, batch_size=self.batch_size_for(model, objects),
+            ignore_conflicts=ignore_conflicts)
+
+    def batch_size_for(self, model, objects):
+        # Django 2.2 takes an explicit batch_size as is, even past the
+        # backend's limit on query parameters (999 on SQLite).
+        fields = model._meta.concrete_fields
+        return min(self.batch_size, connection.ops.bulk_batch_size(fields, objects))
+
+    def resolve_users(self, usernames):
+        missing = set(usernames) - self.users.keys()
+        if not missing:
+            return
+        existing = User.objects.filter(username__in=missing).values_list('username', 'pk')
+        self.users.update(existing)
+        new = missing - self.users.keys()
+        if new:
+            password = make_password(None)
+            self.insert(
+                User, [User(username=username, password=password) for username in new])
+            self.users.update(
+                User.objects.filter(username__in=new).values_list('username', 'pk'))
+
+    def resolve_groups(self, slugs):
+        missing = set(slugs) - self.groups.keys()
+        if not missing:
+            return
+        new = missing - set(Group.objects.filter(slug__in=missing).values_list('slug', flat=True))
+        self.insert(
+            Group, [Group(title=slug, slug=slug, description='') for slug in new])
+        self.groups.update(
+            Group.objects.filter(slug__in=missing).values_list('slug', 'pk'))
+
+    def date(self, value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f'Неверная дата: {value}')
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
@@ -0,0 +1,48 @@
+import os
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def copy_database(target):
+    """Copy the primary database to ``target`` with SQLite's backup API.
+
+    The backup is consistent even while the primary is being written to.
+    It is written next to ``target`` and renamed over it, so readers
+    never see a half-copied file. The copy is switched to the rollback
+    journal: a leftover WAL file must never be replayed onto a new copy.
+    """
+    primary = connections[DEFAULT_DB_ALIAS]
+    primary.ensure_connection()
+    partial = f'{target}.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+    copy = sqlite3.connect(partial)
+    try:
+        primary.connection.backup(copy)
+        copy.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        copy.close()
+    os.replace(partial, target)
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файлы реплик для чтения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Какие реплики обновить (по умолчанию все из DATABASE_REPLICAS)')
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.DATABASE_REPLICAS
+        if not aliases:
+            raise CommandError('Реплики не настроены: задайте YATUBE_DB_REPLICAS')
+        for alias in aliases:
+            if alias not in settings.DATABASE_REPLICAS:
+                raise CommandError(f'{alias} не реплика')
+            connections[alias].close()
+            copy_database(connections[alias].settings_dict['NAME'])
+            self.stdout.write(self.style.SUCCESS(f'{alias} обновлена'))
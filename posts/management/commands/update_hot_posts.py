@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts import hot
+from posts.cache import bump_generation
+from posts.models import HotPost
+
+
+class Command(BaseCommand):
+    help = 'Убирает остывшие посты из популярных (запускать по расписанию)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересчитать популярность заново по свежим комментариям')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            hot.rebuild()
+            bump_generation()
+            self.stdout.write(self.style.SUCCESS(
+                f'Популярность пересчитана: {HotPost.objects.count()} постов'))
+            return
+        deleted = hot.compact()
+        if deleted:
+            bump_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено остывших: {deleted}, осталось: {HotPost.objects.count()}'))
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.6 on 2026-10-18 19:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    """Give every follower the newest posts of the authors they follow.
+
+    The same limits as ``timeline.backfill``: at most
+    ``TIMELINE_BACKFILL_LIMIT`` posts per author, and none for authors
+    with more than ``TIMELINE_FANOUT_LIMIT`` followers, which are merged
+    on read. ``UserStats`` does not exist yet, so followers are counted
+    here. One ``INSERT ... SELECT`` does it all in the database.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT INTO {timeline} (user_id, post_id, pub_date)'
+            ' SELECT f.user_id, p.id, p.pub_date FROM {follow} f'
+            ' JOIN (SELECT author_id FROM {follow} GROUP BY author_id'
+            '   HAVING COUNT(*) <= %s) a ON a.author_id = f.author_id'
+            ' JOIN (SELECT id, author_id, pub_date, ROW_NUMBER() OVER ('
+            '   PARTITION BY author_id ORDER BY pub_date DESC, id DESC) AS position'
+            '   FROM {post}) p ON p.author_id = f.author_id AND p.position <= %s'.format(
+                timeline=TimelineEntry._meta.db_table, follow=Follow._meta.db_table,
+                post=Post._meta.db_table),
+            [settings.TIMELINE_FANOUT_LIMIT, settings.TIMELINE_BACKFILL_LIMIT])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_auto_20200805_1741'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_feed_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('user', 'post')},
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
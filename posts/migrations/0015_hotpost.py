@@ -0,0 +1,32 @@
+# Generated by Django 2.2.6 on 2026-10-18 20:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_hot_posts(apps, schema_editor):
+    from posts import hot
+    hot.rebuild(comments=apps.get_model('posts', 'Comment'),
+                hot_posts=apps.get_model('posts', 'HotPost'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotPost',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='hot', serialize=False, to='posts.Post')),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='hotpost',
+            index=models.Index(fields=['-score', '-post'], name='hot_post_score_idx'),
+        ),
+        migrations.RunPython(fill_hot_posts, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import json
+
 from django.db import models
 from django.contrib.auth import get_user_model
 
@@ -13,20 +15,41 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Load everything a post card renders without per-post queries."""
+        return self.select_related('author', 'group')
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='author_posts')
     group = models.ForeignKey(
     Group, on_delete=models.CASCADE, related_name='group_posts', blank=True, null=True)
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # JSON with the pre-rendered image variants, see images.py
+    image_variants = models.TextField(blank=True, default='', editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_feed_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'], name='post_author_feed_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'], name='post_group_feed_idx'),
+        ]
 
     def __str__(self):
         return self.text
 
+    @property
+    def variants(self):
+        return json.loads(self.image_variants) if self.image_variants else {}
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
@@ -34,10 +57,54 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField('Дата публикации', auto_now_add=True)
 
+    class Meta:
+        ordering = ['created']
+        indexes = [
+            models.Index(fields=['post', 'created'], name='comment_post_idx'),
+        ]
+
 
 class Follow(models.Model):
     user  = models.ForeignKey(User, on_delete=models.CASCADE, related_name="follower")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name="following")
         
     class Meta:
-        unique_together = ['user', 'author']
\ No newline at end of file
+        unique_together = ['user', 'author']
+        indexes = [
+            models.Index(fields=['author', 'user'], name='follow_author_idx'),
+        ]
+
+class TimelineEntry(models.Model):
+    """A post delivered to a follower's inbox (fan-out on write)."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="timeline")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="timeline_entries")
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_feed_idx'),
+        ]
+
+
+
+class UserStats(models.Model):
+    """Counters maintained on every post and follow write (see counters.py)."""
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+
+
+class HotPost(models.Model):
+    """A post's comment activity with time decay (see hot.py)."""
+    post = models.OneToOneField(
+        Post, on_delete=models.CASCADE, primary_key=True, related_name="hot")
+    # Natural log of the decayed comment weight, measured at hot.EPOCH.
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score', '-post'], name='hot_post_score_idx'),
+        ]
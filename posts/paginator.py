@@ -0,0 +1,145 @@
+"""Keyset (cursor) pagination for post feeds.
+
+A page is addressed by an opaque ``?cursor=`` token that holds the
+``(pub_date, id)`` of the row it starts after, so every page is a range
+read over the feed index no matter how deep the reader has gone, and no
+``COUNT(*)`` or ``OFFSET`` is ever issued.
+"""
+import base64
+import binascii
+import heapq
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db.models import DateField, Q
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, value, pk):
+    value = value.isoformat() if isinstance(value, datetime) else repr(value)
+    raw = f'{direction}|{value}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return ``(direction, value, pk)`` or ``None`` for a bad token.
+
+    ``value`` is a datetime for date-keyed feeds and a float otherwise
+    (search relevance).
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        direction, value, pk = raw.decode().split('|')
+        value = parse_datetime(value) or float(value)
+        pk = int(pk)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return None
+    if direction not in (NEXT, PREVIOUS):
+        return None
+    return direction, value, pk
+
+
+def older_than(keys, value, pk):
+    # The leading ``<=`` keeps the lookup a range scan on the
+    # ``(pub_date, id)`` index; the OR only resolves ties inside it.
+    value_key, pk_key = keys
+    return (Q(**{f'{value_key}__lte': value})
+            & (Q(**{f'{value_key}__lt': value}) | Q(**{f'{pk_key}__lt': pk})))
+
+
+def newer_than(keys, value, pk):
+    value_key, pk_key = keys
+    return (Q(**{f'{value_key}__gte': value})
+            & (Q(**{f'{value_key}__gt': value}) | Q(**{f'{pk_key}__gt': pk})))
+
+
+class CursorPaginator:
+    """Paginate posts newest first by ``(pub_date, id)``.
+
+    ``object_list`` is a queryset, or a list of querysets that are merged
+    into one feed. ``keys`` names the columns to order by, descending: a
+    date (or a float score) and an id. Each row must expose them as
+    attributes, so they may be annotations.
+
+    ``get_page`` returns a regular ``Page`` over the fetched rows with two
+    extra attributes, ``next_cursor`` and ``previous_cursor``, holding the
+    tokens for the neighbouring pages (``None`` at either end). A token
+    that does not decode, or whose value is not of the feed's key type
+    (a cursor carried over from another feed), yields the first page.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'pk')):
+        if not isinstance(object_list, (list, tuple)):
+            object_list = [object_list]
+        self.sources = object_list
+        self.per_page = per_page
+        self.keys = keys
+
+    def get_page(self, cursor=None):
+        position = decode_cursor(cursor) if cursor else None
+        if position is not None and not isinstance(position[1], self._value_type()):
+            position = None
+        if position is None:
+            rows = self._fetch(None, descending=True)
+            has_next, has_previous = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        else:
+            direction, value, pk = position
+            if direction == NEXT:
+                rows = self._fetch(
+                    older_than(self.keys, value, pk), descending=True)
+                has_next, has_previous = len(rows) > self.per_page, True
+                rows = rows[:self.per_page]
+            else:
+                rows = self._fetch(
+                    newer_than(self.keys, value, pk), descending=False)
+                if len(rows) <= self.per_page:
+                    # Walked back to the head of the feed: serve it fresh,
+                    # including anything published since the reader left.
+                    return self.get_page()
+                has_next, has_previous = True, True
+                rows = rows[:self.per_page][::-1]
+
+        page = Paginator(rows, self.per_page).page(1)
+        page.next_cursor = (
+            encode_cursor(NEXT, *self._key(rows[-1]))
+            if has_next and rows else None)
+        page.previous_cursor = (
+            encode_cursor(PREVIOUS, *self._key(rows[0]))
+            if has_previous and rows else None)
+        return page
+
+    def _value_type(self):
+        queryset, name = self.sources[0], self.keys[0]
+        field = queryset.query.annotations.get(name)
+        try:
+            field = field.output_field if field is not None else (
+                queryset.model._meta.get_field(name))
+        except FieldDoesNotExist:
+            # ``queryset.none()`` without the annotation: no page to find.
+            return type(None)
+        return datetime if isinstance(field, DateField) else float
+
+    def _key(self, row):
+        return tuple(getattr(row, key) for key in self.keys)
+
+    def _fetch(self, condition, descending):
+        ordering = [f'-{key}' if descending else key for key in self.keys]
+        limit = self.per_page + 1
+        fetched = []
+        for queryset in self.sources:
+            if condition is not None:
+                queryset = queryset.filter(condition)
+            fetched.append(list(queryset.order_by(*ordering)[:limit]))
+        if len(fetched) == 1:
+            return fetched[0]
+        rows, seen = [], set()
+        for row in heapq.merge(*fetched, key=self._key, reverse=descending):
+            if row.pk not in seen:
+                seen.add(row.pk)
+                rows.append(row)
+        return rows[:limit]
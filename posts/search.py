@@ -0,0 +1,86 @@
+"""Full-text search over ``Post.text`` backed by an SQLite FTS5 table.
+
+``posts_post_fts`` keeps its own copy of every post's text keyed by the
+post id. It is filled by migration 0013 and kept in sync from the post
+save and delete signals. On other database backends searching falls
+back to a plain ``icontains`` lookup.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'posts_post_fts'
+KEYS = ('relevance', 'pk')
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every word, as a prefix, ANDed.
+
+    Quoting each word keeps user input from being read as FTS5 syntax.
+    """
+    words = re.findall(r'\w+', query)
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def index_post(post):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text])
+
+
+def unindex_post(post):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+
+
+def rebuild():
+    """Reindex every post, e.g. after rows were inserted in bulk."""
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, text) SELECT id, text FROM posts_post')
+
+
+def filter_posts(queryset, query):
+    """Restrict ``queryset`` to posts matching ``query``, unranked."""
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not enabled():
+        return queryset.filter(text__icontains=query)
+    return queryset.extra(
+        where=[f'posts_post.id IN (SELECT rowid FROM {FTS_TABLE} '
+               f'WHERE {FTS_TABLE} MATCH %s)'],
+        params=[expression],
+    )
+
+
+def rank_posts(queryset, query):
+    """Matching posts annotated with ``relevance`` (higher is better).
+
+    Paginate the result with ``CursorPaginator`` and ``KEYS``.
+    """
+    expression = match_expression(query)
+    if not expression:
+        return queryset.none()
+    if not enabled():
+        return queryset.filter(text__icontains=query).annotate(
+            relevance=RawSQL('0.0', [], output_field=FloatField()))
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = posts_post.id', f'{FTS_TABLE} MATCH %s'],
+        params=[expression],
+    ).annotate(relevance=RawSQL(f'-{FTS_TABLE}.rank', [], output_field=FloatField()))
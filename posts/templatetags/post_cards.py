@@ -0,0 +1,18 @@
+from django import template
+
+from posts.cards import render_cards
+from posts.images import card_image as card_image_attrs
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    """Render a page of post cards through the fragment cache."""
+    return render_cards(posts, context.get('user'))
+
+
+@register.inclusion_tag('includes/card_image.html')
+def card_image(post):
+    """The card picture with ``srcset`` built from the stored variants."""
+    return {'image': card_image_attrs(post)}
@@ -1,15 +1,28 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.test import Client
 from django.core import mail
 from django.contrib.auth.models import User
-from .models import Post, Group, Follow, Comment
+from .cache import cache_stats
+from .models import Post, Group, Follow, Comment, TimelineEntry, UserStats
+from .management.commands.import_jsonl import Command as ImportCommand
 from django.urls import reverse
 from django.core.cache import cache
+from django.db import connection
+from django.db.models import Sum
+from django.test.utils import CaptureQueriesContext, override_settings
 import mock
 from django.core.files import File
 from PIL import Image
-from io import BytesIO
+from io import BytesIO, StringIO
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template.defaultfilters import filesizeformat
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
 
 
 class PostsTest(TestCase):
@@ -197,6 +210,7 @@ class PostsTest(TestCase):
         self.assertFormError(response,form='form', field='image', errors='Загрузите правильное изображение. Файл, который вы загрузили, поврежден или не является изображением.')
 		
     def test_cache_index(self):
+        self.authorized_client.get(reverse("index"))
         self.authorized_client.post(
             reverse("new_post"),
             data={
@@ -206,7 +220,16 @@ class PostsTest(TestCase):
             follow=True
         )
         response = self.authorized_client.get(reverse("index"))
-        self.assertNotContains(response, "Джонни Кэш")
+        self.assertContains(response, "Джонни Кэш")
+
+    def test_cache_index_serves_cached_page(self):
+        self.response_auth()
+        self.authorized_client.get(reverse("index"))
+        hits = cache_stats()["hits"]
+        Post.objects.update(text="Тихая правка")
+        response = self.authorized_client.get(reverse("index"))
+        self.assertNotContains(response, "Тихая правка")
+        self.assertEqual(cache_stats()["hits"], hits + 1)
 
     def test_subscribe(self):
         self.authorized_client.post(reverse("profile_follow", kwargs={
@@ -264,4 +287,1248 @@ class PostsTest(TestCase):
 
     def test_index_unfollow(self):
         self.response_auth_another_user()
-        self.check_post_not_equal(reverse("follow_index"), self.text)
\ No newline at end of file
+        self.check_post_not_equal(reverse("follow_index"), self.text)
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="petya")
+        self.client = Client()
+        for i in range(25):
+            Post.objects.create(text=f"Пост {i}", author=self.user)
+        # Half of the feed shares one timestamp to exercise the id tie-break.
+        Post.objects.filter(pk__lte=Post.objects.order_by("pk")[12].pk).update(
+            pub_date=Post.objects.order_by("pk")[12].pub_date)
+        self.expected = list(Post.objects.order_by("-pub_date", "-pk")
+                             .values_list("pk", flat=True))
+
+    def get_page(self, cursor=None):
+        cache.clear()
+        data = {"cursor": cursor} if cursor else {}
+        return self.client.get(reverse("index"), data).context["page"]
+
+    def test_walk_forward_and_back(self):
+        pages = [self.get_page()]
+        while pages[-1].next_cursor:
+            pages.append(self.get_page(pages[-1].next_cursor))
+        seen = [post.pk for page in pages for post in page]
+        self.assertEqual(seen, self.expected)
+        self.assertEqual(len(pages), 3)
+        self.assertIsNone(pages[0].previous_cursor)
+
+        back = self.get_page(pages[2].previous_cursor)
+        self.assertEqual([post.pk for post in back], [post.pk for post in pages[1]])
+        back = self.get_page(back.previous_cursor)
+        self.assertEqual([post.pk for post in back], self.expected[:10])
+        self.assertIsNone(back.previous_cursor)
+
+    def test_bad_cursor_falls_back_to_first_page(self):
+        page = self.get_page("not-a-cursor")
+        self.assertEqual([post.pk for post in page], self.expected[:10])
+
+    def test_cursor_of_another_key_type_falls_back_to_first_page(self):
+        from django.utils import timezone
+        from .paginator import NEXT, encode_cursor
+        score_cursor = encode_cursor(NEXT, 1.5, self.expected[0])
+        page = self.get_page(score_cursor)
+        self.assertEqual([post.pk for post in page], self.expected[:10])
+        for url in (reverse("api_index"), reverse("profile", args=["petya"]),
+                    reverse("post_comments", args=["petya", self.expected[0]])):
+            self.assertEqual(self.client.get(url, {"cursor": score_cursor}).status_code, 200)
+        date_cursor = encode_cursor(NEXT, timezone.now(), self.expected[0])
+        for url, data in ((reverse("popular"), {}), (reverse("search"), {"q": "Пост"})):
+            response = self.client.get(url, dict(data, cursor=date_cursor))
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.context["page"].previous_cursor)
+
+    def test_no_count_or_offset(self):
+        first = self.get_page()
+        with CaptureQueriesContext(connection) as queries:
+            self.get_page(first.next_cursor)
+        for query in queries.captured_queries:
+            self.assertNotIn("COUNT(*)", query["sql"])
+            self.assertNotIn("OFFSET", query["sql"])
+
+
+class TimelineTest(TestCase):
+    def setUp(self):
+        self.reader = User.objects.create_user(username="reader")
+        self.author = User.objects.create_user(username="writer")
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.old_post = Post.objects.create(text="Старый пост", author=self.author)
+
+    def follow(self):
+        self.client.get(reverse("profile_follow", kwargs={"username": self.author}))
+
+    def feed(self):
+        response = self.client.get(reverse("follow_index"))
+        return [post.text for post in response.context["page"]]
+
+    def test_follow_backfills_and_new_posts_fan_out(self):
+        self.follow()
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 1)
+        self.author_client.post(reverse("new_post"), data={"text": "Новый пост"})
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 2)
+        self.assertEqual(self.feed(), ["Новый пост", "Старый пост"])
+
+    def test_unfollow_prunes_inbox(self):
+        self.follow()
+        self.client.get(reverse("profile_unfollow", kwargs={"username": self.author}))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_authors_are_merged_on_read(self):
+        self.follow()
+        self.author_client.post(reverse("new_post"), data={"text": "Новый пост"})
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.feed(), ["Новый пост", "Старый пост"])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_author_back_under_limit_is_fanned_out_again(self):
+        other = User.objects.create_user(username="other")
+        self.follow()
+        Follow.objects.create(user=other, author=self.author)
+        self.author_client.post(reverse("new_post"), data={"text": "Новый пост"})
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 1)
+        with mock.patch("posts.signals.transaction.on_commit", lambda func: func()):
+            Follow.objects.filter(user=other).delete()
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 2)
+        self.assertEqual(self.feed(), ["Новый пост", "Старый пост"])
+
+
+class TimelineMigrationTest(TestCase):
+    @override_settings(TIMELINE_BACKFILL_LIMIT=2, TIMELINE_FANOUT_LIMIT=1)
+    def test_backfill_respects_limits(self):
+        import importlib
+        from django.apps import apps
+        migration = importlib.import_module("posts.migrations.0009_timelineentry")
+        reader, other = (User.objects.create_user(username=n) for n in ("reader", "other"))
+        author, star = (User.objects.create_user(username=n) for n in ("author", "star"))
+        posts = [Post.objects.create(text=f"Пост {i}", author=author) for i in range(3)]
+        Post.objects.create(text="Звёздный пост", author=star)
+        Follow.objects.create(user=reader, author=author)
+        Follow.objects.create(user=reader, author=star)
+        Follow.objects.create(user=other, author=star)
+        TimelineEntry.objects.all().delete()
+        migration.fill_timelines(apps, mock.Mock(connection=connection))
+        self.assertEqual(
+            sorted(TimelineEntry.objects.values_list("user__username", "post_id")),
+            [("reader", posts[1].pk), ("reader", posts[2].pk)])
+
+
+class FeedQueriesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="kolya")
+        self.group = Group.objects.create(title="Группа", slug="group")
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(text=f"Пост {i}", author=self.user, group=self.group)
+            Comment.objects.create(post=post, author=self.user, text="Комментарий")
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        urls = [
+            reverse("index"),
+            reverse("group_posts", kwargs={"slug": self.group.slug}),
+            reverse("profile", kwargs={"username": self.user.username}),
+        ]
+        self.add_posts(1)
+        small = [self.count_queries(url) for url in urls]
+        self.add_posts(9)
+        full = [self.count_queries(url) for url in urls]
+        self.assertEqual(small, full)
+
+    def test_card_shows_comment_count(self):
+        self.add_posts(1)
+        cache.clear()
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.context["page"][0].comment_count, 1)
+        self.assertContains(response, "1 комментариев")
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="masha")
+        self.author = User.objects.create_user(username="sasha")
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_write_paths_update_counters(self):
+        self.client.post(reverse("new_post"), data={"text": "Пост"})
+        post = Post.objects.get()
+        self.client.post(reverse("add_comment", kwargs={
+            "username": self.user.username, "post_id": post.id}),
+            data={"text": "Комментарий"})
+        self.client.get(reverse("profile_follow", kwargs={"username": self.author}))
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.user).posts_count, 1)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+
+        self.client.get(reverse("profile_unfollow", kwargs={"username": self.author}))
+        post.comments.all().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.user).following_count, 0)
+
+    def test_profile_shows_counters(self):
+        Follow.objects.create(user=self.user, author=self.author)
+        response = self.client.get(reverse("profile", kwargs={"username": self.author}))
+        self.assertContains(response, "Подписчиков: 1")
+        self.assertContains(response, "Подписан: 0")
+
+    def test_recount_repairs_drift(self):
+        post = Post.objects.create(text="Пост", author=self.author)
+        Comment.objects.create(post=post, author=self.user, text="Комментарий")
+        Follow.objects.create(user=self.user, author=self.author)
+        UserStats.objects.update(posts_count=42, followers_count=7, following_count=3)
+        Post.objects.update(comment_count=9)
+        call_command("recount_counters", stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        self.assertEqual(self.stats(self.user).posts_count, 0)
+
+
+class PostCardCacheTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="glasha")
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(text="Первая версия", author=self.user)
+        self.requests = 0
+        cache.clear()
+
+    def get_index(self, client=None):
+        # A fresh query string each time skips the whole-page cache.
+        self.requests += 1
+        client = client or self.client
+        return client.get(reverse("index"), {"r": self.requests})
+
+    def test_cards_are_served_from_cache(self):
+        self.get_index()
+        # A raw update bypasses the version, so the cached card is served.
+        Post.objects.filter(pk=self.post.pk).update(text="Тихая правка")
+        self.assertContains(self.get_index(), "Первая версия")
+
+    def test_edit_and_comment_change_the_card(self):
+        self.get_index()
+        self.client.post(reverse("post_edit", kwargs={
+            "username": self.user.username, "post_id": self.post.id}),
+            data={"text": "Вторая версия"})
+        self.assertContains(self.get_index(), "Вторая версия")
+        Comment.objects.create(post=self.post, author=self.user, text="Комментарий")
+        self.assertContains(self.get_index(), "1 комментариев")
+
+    def test_edit_link_only_for_author(self):
+        self.get_index()
+        self.assertNotContains(self.get_index(Client()), "Редактировать")
+        self.assertContains(self.get_index(), "Редактировать")
+
+
+class FeedIndexTest(TestCase):
+    def plan(self, queryset):
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return " | ".join(row[-1] for row in cursor.fetchall())
+
+    def test_feed_queries_walk_indexes(self):
+        feed = Post.objects.for_feed().order_by("-pub_date", "-pk")
+        expected = {
+            "post_feed_idx": feed[:11],
+            "post_author_feed_idx": feed.filter(author=1)[:11],
+            "post_group_feed_idx": feed.filter(group=1)[:11],
+            "comment_post_idx": Comment.objects.filter(post=1),
+            "follow_author_idx": Follow.objects.filter(author=1).values("user"),
+        }
+        for index, queryset in expected.items():
+            plan = self.plan(queryset)
+            self.assertIn(index, plan)
+            self.assertNotIn("TEMP B-TREE", plan)
+
+
+class SearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="fedya")
+        self.client = Client()
+        Post.objects.create(text="Кошки и собаки", author=self.user)
+        Post.objects.create(text="Кошки, кошки, кошки!", author=self.user)
+        self.dogs = Post.objects.create(text="Только собаки", author=self.user)
+
+    def search(self, query, **params):
+        response = self.client.get(reverse("search"), {"q": query, **params})
+        return response, [post.text for post in response.context["page"]]
+
+    def test_results_are_ranked(self):
+        response, found = self.search("кошки")
+        self.assertEqual(found, ["Кошки, кошки, кошки!", "Кошки и собаки"])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.dogs.text = "Только хомяки"
+        self.dogs.save()
+        self.assertEqual(self.search("хомяк")[1], ["Только хомяки"])
+        self.dogs.delete()
+        self.assertEqual(self.search("хомяк")[1], [])
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(self.search('"собаки" (')[1],
+                         ["Только собаки", "Кошки и собаки"])
+
+    def test_results_are_paginated(self):
+        for i in range(12):
+            Post.objects.create(text=f"Хомяк номер {i}", author=self.user)
+        response, first = self.search("хомяк")
+        cursor = response.context["page"].next_cursor
+        self.assertContains(response, f"q=%D1%85%D0%BE%D0%BC%D1%8F%D0%BA&amp;cursor={cursor}")
+        second = self.search("хомяк", cursor=cursor)[1]
+        self.assertEqual(len(first) + len(second), 12)
+        self.assertFalse(set(first) & set(second))
+
+    def test_admin_search_uses_index(self):
+        admin = User.objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(admin)
+        response = self.client.get("/admin/posts/post/", {"q": "хомяк собак"})
+        self.assertEqual(response.context["cl"].result_count, 0)
+        response = self.client.get("/admin/posts/post/", {"q": "собак"})
+        self.assertEqual(response.context["cl"].result_count, 2)
+
+
+class GenerateDataTest(TestCase):
+    def test_generates_consistent_dataset(self):
+        call_command("generate_data", "--users=30", "--groups=3", "--posts=200",
+                     "--comments=300", "--follows=5", stdout=StringIO())
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertTrue(Follow.objects.exists())
+        stats = UserStats.objects.aggregate(
+            posts=Sum("posts_count"), followers=Sum("followers_count"))
+        self.assertEqual(stats["posts"], 200)
+        self.assertEqual(stats["followers"], Follow.objects.count())
+        self.assertEqual(Post.objects.aggregate(total=Sum("comment_count"))["total"], 300)
+        follow = Follow.objects.first()
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=follow.user, post__author=follow.author).count(),
+            follow.author.author_posts.count())
+
+    def test_generated_comments_page_like_real_ones(self):
+        from .views import comment_page
+        call_command("generate_data", "--users=10", "--groups=1", "--posts=5",
+                     "--comments=200", "--follows=2", stdout=StringIO())
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT created || '' FROM posts_comment LIMIT 1")
+            self.assertNotIn("+00:00", cursor.fetchone()[0])
+        post = Post.objects.order_by("-comment_count").first()
+        first, cursor = comment_page(post)
+        rest, _ = comment_page(post, cursor)
+        first, rest = [c.pk for c in first], [c.pk for c in rest]
+        self.assertTrue(rest)
+        self.assertFalse(set(first) & set(rest))
+        self.assertGreater(Comment.objects.values("created").distinct().count(), 1)
+
+    def test_ids_continue_after_deleted_rows(self):
+        writer = User.objects.create_user(username="writer")
+        Post.objects.create(text="Удалённый пост", author=writer).delete()
+        User.objects.create_user(username="gone").delete()
+        call_command("generate_data", "--users=10", "--groups=1", "--posts=20",
+                     "--comments=50", "--follows=2", stdout=StringIO())
+        self.assertFalse(Post.objects.exclude(author__in=User.objects.all()).exists())
+        self.assertFalse(Comment.objects.exclude(post__in=Post.objects.all()).exists())
+        self.assertEqual(Post.objects.aggregate(total=Sum("comment_count"))["total"], 50)
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="metrics")
+        Post.objects.create(text="Пост для метрик", author=self.user)
+
+    @override_settings(METRICS_SAMPLE_RATE=1, METRICS_SLOW_REQUEST_MS=10 ** 6)
+    def test_sampled_request_reports_server_timing(self):
+        with self.assertLogs("yatube.requests", "INFO") as logs:
+            response = self.client.get(reverse("index"))
+        timing = response["Server-Timing"]
+        self.assertIn("db;dur=", timing)
+        self.assertIn("tpl;dur=", timing)
+        self.assertIn('cache;desc="0 hits, 2 misses"', timing)
+        self.assertIn('"view": "index"', logs.output[0])
+        self.assertIn('"queries": ', logs.output[0])
+
+        response = self.client.get(reverse("index"))
+        self.assertIn('cache;desc="1 hits, 0 misses"', response["Server-Timing"])
+
+    @override_settings(METRICS_SAMPLE_RATE=0, METRICS_SLOW_REQUEST_MS=0)
+    def test_unsampled_slow_request_is_logged(self):
+        with self.assertLogs("yatube.requests", "WARNING") as logs:
+            response = self.client.get(reverse("index"))
+        self.assertFalse(response.has_header("Server-Timing"))
+        self.assertIn('"total_ms": ', logs.output[0])
+
+
+@override_settings(IMAGE_WORKERS=0)
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="painter")
+        self.client.force_login(self.user)
+
+    def upload(self):
+        file = BytesIO()
+        Image.new("RGB", size=(400, 300), color=(0, 5, 0)).save(file, "png")
+        return SimpleUploadedFile("thumb.png", file.getvalue(), content_type="image/png")
+
+    def test_new_post_schedules_variants(self):
+        # TestCase never commits, so run on_commit callbacks right away.
+        with mock.patch("posts.images.transaction.on_commit", lambda func: func()):
+            self.client.post(reverse("new_post"), data={"text": "С картинкой", "image": self.upload()})
+        post = Post.objects.get()
+        formats = post.variants["card"]
+        self.assertEqual(set(formats), {"webp", "png"})
+        for variants in formats.values():
+            self.assertEqual([v["width"] for v in variants], [320, 480, 720, 960])
+            self.assertEqual(variants[-1]["height"], 339)
+            self.assertTrue(all(v["bytes"] > 0 for v in variants))
+        response = self.client.get(reverse("post", args=[self.user.username, post.pk]))
+        self.assertContains(response, f'{formats["webp"][0]["url"]} 320w')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, f'src="{formats["png"][-1]["url"]}"')
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_card_falls_back_to_original(self):
+        self.client.post(reverse("new_post"), data={"text": "С картинкой", "image": self.upload()})
+        post = Post.objects.get()
+        self.assertEqual(post.variants, {})
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertNotContains(response, "srcset")
+
+    def test_card_without_fallback_variants_shows_original(self):
+        post = Post.objects.create(
+            text="Только WebP", author=self.user, image="posts/thumb.png",
+            image_variants=json.dumps({"card": {"webp": [
+                {"url": "/media/cache/a.webp", "width": 320, "height": 113, "bytes": 1}]}}))
+        from .images import card_image
+        self.assertEqual(card_image(post), {"src": post.image.url})
+
+    def test_backfill_command(self):
+        self.client.post(reverse("new_post"), data={"text": "С картинкой", "image": self.upload()})
+        Post.objects.create(text="Файл потерян", author=self.user, image="posts/missing.png")
+        out = StringIO()
+        call_command("generate_thumbnails", "--workers=0", stdout=out)
+        self.assertIn("Готово миниатюр: 1", out.getvalue())
+        self.assertEqual(Post.objects.exclude(image_variants="").count(), 1)
+
+
+class UploadLimitsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="uploader")
+        self.client.force_login(self.user)
+
+    def upload(self, size=(40, 20), exif=None, fmt="jpeg"):
+        file = BytesIO()
+        image = Image.new("RGB", size=size, color=(200, 10, 10))
+        image.save(file, fmt, **({"exif": exif} if exif else {}))
+        return SimpleUploadedFile(f"photo.{fmt}", file.getvalue(), content_type=f"image/{fmt}")
+
+    def post(self, image):
+        return self.client.post(reverse("new_post"), data={"text": "Фото", "image": image})
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1024)
+    def test_oversized_file_is_rejected(self):
+        response = self.post(self.upload(size=(600, 600), fmt="png"))
+        self.assertFormError(response, "form", "image", f"Файл больше {filesizeformat(1024)}.")
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=1024)
+    def test_limit_applies_only_to_post_views(self):
+        admin = User.objects.create_superuser("boss", "boss@example.com", "12345")
+        self.client.force_login(admin)
+        response = self.client.post(reverse("admin:posts_post_add"), data={
+            "text": "Из админки", "author": admin.pk,
+            "image": self.upload(size=(600, 600), fmt="png")})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Post.objects.get().image)
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=100)
+    def test_too_many_pixels_is_rejected(self):
+        response = self.post(self.upload(size=(20, 20)))
+        self.assertFormError(response, "form", "image", "Слишком большое изображение: 20×20 точек.")
+
+    def test_exif_is_stripped_and_orientation_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90° clockwise
+        exif[0x010F] = "Camera"
+        self.post(self.upload(exif=exif.tobytes()))
+        with Image.open(Post.objects.get().image) as image:
+            self.assertEqual(image.size, (20, 40))
+            self.assertFalse(image.getexif())
+
+    def test_image_without_exif_is_kept_as_is(self):
+        upload = self.upload(fmt="png")
+        content = upload.read()
+        upload.seek(0)
+        self.post(upload)
+        with Post.objects.get().image.open() as stored:
+            self.assertEqual(stored.read(), content)
+
+
+class ImportJsonlTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "archive.jsonl")
+        records = [
+            {"type": "post", "id": 501, "author": "leo", "group": "cats",
+             "text": "Архивный пост про котов", "pub_date": "2015-03-01T10:00:00+00:00"},
+            {"type": "post", "id": 502, "author": "anna", "text": "Второй пост",
+             "pub_date": "2015-03-02T10:00:00+00:00"},
+            {"type": "comment", "id": 900, "post": 501, "author": "anna",
+             "text": "Мяу", "created": "2015-03-03T10:00:00+00:00"},
+            {"type": "comment", "id": 901, "post": 404, "author": "anna",
+             "text": "К потерянному посту", "created": "2015-03-03T10:00:00+00:00"},
+            {"type": "follow", "user": "anna", "author": "leo"},
+        ]
+        with open(self.path, "w") as fh:
+            fh.write("\n".join(json.dumps(r, ensure_ascii=False) for r in records))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command("import_jsonl", self.path, "--chunk-size=2", *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_keeps_archive_dates(self):
+        output = self.run_import()
+        self.assertIn("Загружено 4, пропущено 1", output)
+        self.assertIn("строк/с", output)
+        post = Post.objects.get(text="Архивный пост про котов")
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(post.author.username, "leo")
+        self.assertEqual(post.group.slug, "cats")
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(Comment.objects.get(post=post).created.year, 2015)
+        self.assertEqual(UserStats.objects.get(user__username="leo").followers_count, 1)
+        anna = User.objects.get(username="anna")
+        self.assertFalse(anna.has_usable_password())
+        self.assertTrue(TimelineEntry.objects.filter(user=anna, post=post).exists())
+        response = self.client.get(reverse("search"), {"q": "котов"})
+        self.assertEqual([p.pk for p in response.context["page"]], [post.pk])
+        self.assertFalse(os.path.exists(self.path + ".checkpoint"))
+        self.assertFalse(os.path.exists(self.path + ".checkpoint.ids"))
+
+    def test_archive_ids_taken_by_live_posts_get_new_ids(self):
+        live = Post.objects.create(
+            pk=501, text="Живой пост", author=User.objects.create_user(username="writer"))
+        output = self.run_import()
+        self.assertIn("Загружено 4, пропущено 1", output)
+        live.refresh_from_db()
+        self.assertEqual(live.text, "Живой пост")
+        self.assertEqual(live.comment_count, 0)
+        archived = Post.objects.get(text="Архивный пост про котов")
+        self.assertNotEqual(archived.pk, 501)
+        self.assertEqual(Comment.objects.get().post, archived)
+
+    def test_import_resumes_from_checkpoint(self):
+        with open(self.path, "rb") as fh:
+            fh.readline()
+            fh.readline()
+            offset = fh.tell()
+        with open(self.path + ".checkpoint", "w") as fh:
+            json.dump({"offset": offset, "line": 2}, fh)
+        output = self.run_import()
+        self.assertIn("Продолжаю со строки 3", output)
+        self.assertFalse(Post.objects.exists())
+        self.assertTrue(Follow.objects.exists())
+
+    def crash_on_checkpoint(self, number, after_write):
+        save_checkpoint = ImportCommand.save_checkpoint
+        calls = []
+
+        def crash(command, path, position):
+            calls.append(position)
+            if after_write:
+                save_checkpoint(command, path, position)
+            if len(calls) == number:
+                raise RuntimeError("сбой")
+            if not after_write:
+                save_checkpoint(command, path, position)
+
+        with mock.patch.object(ImportCommand, "save_checkpoint", crash):
+            with self.assertRaises(RuntimeError):
+                self.run_import()
+
+    def test_chunk_committed_before_its_checkpoint_is_not_replayed(self):
+        # The first chunk commits, then the process dies before the
+        # checkpoint that moves past it is written.
+        self.crash_on_checkpoint(2, after_write=False)
+        self.assertIn("Продолжаю со строки 3", self.run_import())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+
+    def test_chunk_rolled_back_after_its_checkpoint_is_replayed(self):
+        self.crash_on_checkpoint(1, after_write=True)
+        self.assertFalse(Post.objects.exists())
+        self.assertIn("Продолжаю со строки 1", self.run_import())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Comment.objects.count(), 1)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="writer")
+        self.reader = User.objects.create_user(username="reader")
+        self.group = Group.objects.create(title="Группа", slug="group", description="")
+        self.first = Post.objects.create(text="Первый", author=self.author, group=self.group)
+        self.second = Post.objects.create(text="Второй", author=self.author)
+        Post.objects.create(text="Чужой", author=self.reader)
+        Comment.objects.create(post=self.second, author=self.reader, text="Ответ")
+        Comment.objects.create(post=self.first, author=self.reader, text="Привет")
+        self.client.force_login(self.author)
+
+    def export(self, **params):
+        response = self.client.get(reverse("export_posts", args=["writer"]), params)
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_jsonl_lists_posts_followed_by_their_comments(self):
+        response, content = self.export()
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="writer.jsonl"')
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [(r["type"], r.get("text")) for r in records],
+            [("post", "Первый"), ("comment", "Привет"), ("post", "Второй"), ("comment", "Ответ")])
+        self.assertEqual(records[0]["group"], "group")
+        self.assertEqual(records[1]["author"], "reader")
+
+    def test_csv(self):
+        response, content = self.export(format="csv")
+        self.assertTrue(response["Content-Type"].startswith("text/csv"))
+        rows = content.splitlines()
+        self.assertEqual(rows[0], "type,id,post,author,group,text,date,image")
+        self.assertEqual(len(rows), 5)
+
+    def test_only_the_author_can_export(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse("export_posts", args=["writer"]))
+        self.assertEqual(response.status_code, 403)
+
+    def test_command_output_can_be_imported_back(self):
+        path = os.path.join(tempfile.mkdtemp(), "writer.jsonl")
+        call_command("export_posts", "writer", f"--output={path}")
+        Post.objects.filter(author=self.author).delete()
+        call_command("import_jsonl", path, stdout=StringIO())
+        self.assertEqual(Post.objects.filter(author=self.author).count(), 2)
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(Post.objects.get(text="Первый").group, self.group)
+        shutil.rmtree(os.path.dirname(path))
+
+
+class ApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="api_author")
+        self.reader = User.objects.create_user(username="api_reader")
+        self.group = Group.objects.create(title="Группа", slug="api", description="")
+        for i in range(12):
+            Post.objects.create(text=f"Пост {i}", author=self.author, group=self.group)
+        self.post = Post.objects.first()
+        Comment.objects.create(post=self.post, author=self.reader, text="Ответ")
+
+    def test_feeds_are_compact_json_with_cursors(self):
+        for url in (reverse("api_index"), reverse("api_group_posts", args=["api"]),
+                    reverse("api_profile", args=["api_author"])):
+            response = self.client.get(url)
+            self.assertEqual(response["Content-Type"], "application/json")
+            self.assertNotIn(b'", "', response.content)
+            data = response.json()
+            self.assertEqual(len(data["results"]), 10)
+            self.assertEqual(data["results"][0]["text"], "Пост 11")
+            second = self.client.get(url, {"cursor": data["next"]}).json()
+            self.assertEqual([p["text"] for p in second["results"]], ["Пост 1", "Пост 0"])
+        profile = self.client.get(reverse("api_profile", args=["api_author"])).json()
+        self.assertEqual(profile["profile"]["posts_count"], 12)
+
+    def test_post_includes_comments(self):
+        data = self.client.get(reverse("api_post", args=["api_author", self.post.pk])).json()
+        self.assertEqual(data["comment_count"], 1)
+        self.assertEqual(data["comments"][0]["author"], "api_reader")
+        missing = self.client.get(reverse("api_post", args=["api_author", 999]))
+        self.assertEqual(missing.status_code, 404)
+
+    def test_post_comments_are_paged(self):
+        for number in range(20):
+            Comment.objects.create(post=self.post, author=self.author, text=f"Ещё {number}")
+        url = reverse("api_post", args=["api_author", self.post.pk])
+        data = self.client.get(url).json()
+        self.assertEqual(len(data["comments"]), 20)
+        rest = self.client.get(url, {"cursor": data["comments_next"]}).json()
+        self.assertEqual([c["text"] for c in rest["comments"]], ["Ещё 19"])
+        self.assertIsNone(rest["comments_next"])
+
+    def test_follow_changes_profile_etag(self):
+        url = reverse("api_profile", args=["api_author"])
+        etag = self.client.get(url)["ETag"]
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["profile"]["followers_count"], 1)
+
+    def test_new_comment_changes_post_etag(self):
+        url = reverse("api_post", args=["api_author", self.post.pk])
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Comment.objects.create(post=self.post, author=self.author, text="Ещё ответ")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_unchanged_feed_gets_304_without_queries(self):
+        url = reverse("api_index")
+        etag = self.client.get(url)["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+        Post.objects.create(text="Новый", author=self.author)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_user_named_api_keeps_post_pages(self):
+        user = User.objects.create_user(username="api")
+        post = Post.objects.create(text="Пост пользователя api", author=user)
+        self.assertContains(self.client.get(reverse("post", args=["api", post.pk])),
+                            "Пост пользователя api")
+        self.assertContains(self.client.get(reverse("profile", args=["api"])),
+                            "Пост пользователя api")
+        self.assertEqual(self.client.get(reverse("api_post", args=["api", post.pk])).json()["id"],
+                         post.pk)
+
+    def test_follow_feed(self):
+        self.assertEqual(self.client.get(reverse("api_follow_index")).status_code, 401)
+        self.client.force_login(self.reader)
+        url = reverse("api_follow_index")
+        response = self.client.get(url)
+        self.assertEqual(response.json()["results"], [])
+        Follow.objects.create(user=self.reader, author=self.author)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 10)
+
+
+class ConditionalViewsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="cond_author")
+        self.reader = User.objects.create_user(username="cond_reader")
+        self.group = Group.objects.create(title="Группа", slug="cond", description="")
+        self.post = Post.objects.create(text="Пост", author=self.author, group=self.group)
+        self.urls = [
+            reverse("post", args=["cond_author", self.post.pk]),
+            reverse("profile", args=["cond_author"]),
+            reverse("group_posts", args=["cond"]),
+        ]
+
+    def assert_revalidates(self, change):
+        etags = {url: self.client.get(url)["ETag"] for url in self.urls}
+        for url, etag in etags.items():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertLessEqual(len(queries), 5, url)
+        change()
+        for url, etag in etags.items():
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200, url)
+
+    def test_new_comment_changes_validators(self):
+        self.assert_revalidates(
+            lambda: Comment.objects.create(post=self.post, author=self.reader, text="Ответ"))
+
+    def test_edit_changes_validators(self):
+        def edit():
+            self.post.text = "Исправленный пост"
+            self.post.save()
+        self.assert_revalidates(edit)
+
+    def test_login_changes_validators(self):
+        self.assert_revalidates(lambda: self.client.force_login(self.reader))
+
+    def test_new_csrf_cookie_changes_validators(self):
+        self.client.cookies["csrftoken"] = "a" * 64
+
+        def rotate():
+            self.client.cookies["csrftoken"] = "b" * 64
+        self.assert_revalidates(rotate)
+
+    def test_follow_changes_profile(self):
+        self.client.force_login(self.reader)
+        url = reverse("profile", args=["cond_author"])
+        etag = self.client.get(url)["ETag"]
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_anonymous_post_page_has_last_modified(self):
+        response = self.client.get(self.urls[0])
+        response = self.client.get(
+            self.urls[0], HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+        self.client.force_login(self.reader)
+        self.assertFalse(self.client.get(self.urls[0]).has_header("Last-Modified"))
+
+
+class AsgiAdapterTest(TestCase):
+    def test_wsgi_application_is_served_over_asgi(self):
+        from yatube.asgi import WsgiToAsgi
+
+        def wsgi_app(environ, start_response):
+            body = environ["wsgi.input"].read()
+            start_response("201 Created", [("X-Path", environ["PATH_INFO"]),
+                                           ("Set-Cookie", "a=1"), ("Set-Cookie", "b=2")])
+            return [environ["QUERY_STRING"].encode(), b"|", environ["HTTP_X_TEST"].encode(),
+                    b"|", body]
+
+        scope = {"type": "http", "method": "POST", "path": "/путь/", "query_string": b"q=1",
+                 "headers": [(b"x-test", b"yes"), (b"content-type", b"text/plain")]}
+        chunks = [{"type": "http.request", "body": b"he", "more_body": True},
+                  {"type": "http.request", "body": b"llo"}]
+        sent = []
+
+        async def receive():
+            return chunks.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(WsgiToAsgi(wsgi_app, 1)(scope, receive, send))
+        start = sent[0]
+        self.assertEqual(start["status"], 201)
+        self.assertIn((b"x-path", "/путь/".encode()),
+                      start["headers"])
+        self.assertEqual([v for k, v in start["headers"] if k == b"set-cookie"], [b"a=1", b"b=2"])
+        self.assertEqual(b"".join(m["body"] for m in sent[1:]), b"q=1|yes|hello")
+        self.assertFalse(sent[-1]["more_body"])
+
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=4, DATA_UPLOAD_MAX_MEMORY_SIZE=2)
+    def test_oversized_body_is_rejected(self):
+        from yatube.asgi import WsgiToAsgi
+        wsgi_app = mock.Mock()
+        for headers, chunks in (
+                ([(b"content-length", b"7")], [{"type": "http.request", "body": b"1234567"}]),
+                ([], [{"type": "http.request", "body": b"1234", "more_body": True},
+                      {"type": "http.request", "body": b"567", "more_body": True}])):
+            scope = {"type": "http", "method": "POST", "path": "/new/", "headers": headers}
+            sent = []
+
+            async def receive():
+                return chunks.pop(0)
+
+            async def send(message):
+                sent.append(message)
+
+            asyncio.run(WsgiToAsgi(wsgi_app, 1)(scope, receive, send))
+            self.assertEqual(sent[0]["status"], 413)
+        wsgi_app.assert_not_called()
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def make_cache(self, **options):
+        from yatube.sqlite_cache import SQLiteCache
+        return SQLiteCache(os.path.join(self.dir, "cache.sqlite3"),
+                           {"OPTIONS": {"CULL_FREQUENCY": 2, **options}})
+
+    def test_values_round_trip(self):
+        cache = self.make_cache()
+        cache.set("post", {"text": "Пост", "tags": [1, 2]})
+        cache.set_many({"a": 1, "b": b"raw"})
+        self.assertEqual(cache.get("post"), {"text": "Пост", "tags": [1, 2]})
+        self.assertEqual(cache.get_many(["a", "b", "c"]), {"a": 1, "b": b"raw"})
+        self.assertFalse(cache.add("a", 2))
+        self.assertTrue(cache.add("c", 3, 0.01))
+        self.assertTrue(cache.has_key("c"))
+        cache.delete_many(["a", "b"])
+        self.assertIsNone(cache.get("a"))
+        with mock.patch("yatube.sqlite_cache.time.time", return_value=time.time() + 1):
+            self.assertFalse(cache.has_key("c"))
+            self.assertTrue(cache.add("c", 4))
+
+    def test_incr_is_atomic_across_processes(self):
+        import multiprocessing
+        cache = self.make_cache()
+        cache.set("counter", 0)
+
+        def worker():
+            for _ in range(100):
+                self.make_cache().incr("counter")
+
+        processes = [multiprocessing.get_context("fork").Process(target=worker)
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(cache.get("counter"), 400)
+        self.assertEqual(cache.decr("counter", 10), 390)
+        with self.assertRaises(ValueError):
+            cache.incr("missing")
+
+    def test_evicts_least_recently_read(self):
+        cache = self.make_cache(MAX_ENTRIES=4)
+        with mock.patch("yatube.sqlite_cache.time.time") as now:
+            for second, key in enumerate("abcd"):
+                now.return_value = 1000 + second * 10
+                cache.set(key, second, None)
+            now.return_value = 1100
+            cache.get("a")
+            now.return_value = 1110
+            cache.set("e", 4, None)
+        self.assertEqual(sorted(cache.get_many("abcde")), ["a", "d", "e"])
+
+    def test_size_bound(self):
+        cache = self.make_cache(MAX_BYTES=10000)
+        for number in range(20):
+            cache.set(f"blob{number}", b"x" * 1000)
+        entries, size = cache._connection().execute(
+            "SELECT entries, bytes FROM cache_usage").fetchone()
+        self.assertLessEqual(size, 10000)
+        self.assertEqual(entries, len(cache.get_many([f"blob{n}" for n in range(20)])))
+        self.assertIn("blob19", cache.get_many(["blob19"]))
+
+
+class StampedeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="stampede", password="12345")
+        Post.objects.create(text="Старый пост", author=self.user)
+
+    def hold_locks(self):
+        add = cache.add
+
+        def busy(key, *args, **kwargs):
+            return False if key.endswith(":lock") else add(key, *args, **kwargs)
+        return mock.patch.object(cache, "add", side_effect=busy)
+
+    def test_previous_generation_served_while_rebuilding(self):
+        self.client.get(reverse("index"))
+        Post.objects.create(text="Новый пост", author=self.user)
+        stale = cache_stats()["stale"]
+        with self.hold_locks(), mock.patch("posts.views.paginate") as paginate:
+            response = self.client.get(reverse("index"))
+        paginate.assert_not_called()
+        self.assertNotContains(response, "Новый пост")
+        self.assertEqual(cache_stats()["stale"], stale + 1)
+        self.assertContains(self.client.get(reverse("index")), "Новый пост")
+
+    def test_fragment_is_built_once(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from .cache import get_or_build
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.2)
+            return "фрагмент"
+
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: get_or_build("fragment", build, 60), range(8)))
+        self.assertEqual(results, ["фрагмент"] * 8)
+        self.assertEqual(len(builds), 1)
+
+    def test_first_page_build_is_single_flight(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .cache import cache_page_versioned
+        builds = []
+
+        @cache_page_versioned(60, key_prefix="first_build")
+        def view(request):
+            builds.append(1)
+            time.sleep(0.2)
+            return HttpResponse("страница")
+
+        request = RequestFactory().get("/first/")
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: view(request).content, range(8)))
+        self.assertEqual(set(results), {"страница".encode()})
+        self.assertEqual(len(builds), 1)
+
+    def test_hits_are_counted_without_cache_writes(self):
+        from .cache import STATS_KEY, count
+        hits = cache_stats()["hits"]
+        with mock.patch.object(cache, "incr") as incr, mock.patch.object(cache, "add") as add:
+            for _ in range(50):
+                count("hits")
+        incr.assert_not_called()
+        add.assert_not_called()
+        self.assertEqual(cache.get(STATS_KEY.format("hits"), 0), hits)
+        self.assertEqual(cache_stats()["hits"], hits + 50)
+
+    def test_early_expiry_grows_with_rebuild_time(self):
+        from .cache import Entry, is_fresh
+        entry = Entry("страница", time.time() + 1, 0.5)
+        with mock.patch("posts.cache.random.random", return_value=0.0):
+            self.assertTrue(is_fresh(entry))
+        with mock.patch("posts.cache.random.random", return_value=0.99):
+            self.assertFalse(is_fresh(entry))
+        self.assertTrue(is_fresh(entry._replace(delta=0.001)))
+
+
+# The replica is a real copy of the test database, made with the backup
+# API, which cannot read the primary while TestCase holds a transaction.
+class ReplicaRoutingTest(TransactionTestCase):
+    alias = "test_replica"
+
+    def setUp(self):
+        from django.db import connections
+        from posts.management.commands.sync_replicas import copy_database
+        cache.clear()
+        self.user = User.objects.create_user(username="replica_user", password="12345")
+        self.post = Post.objects.create(text="Пост на реплике", author=self.user)
+        self.client.force_login(self.user)
+        path = os.path.join(tempfile.mkdtemp(), "replica.sqlite3")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        copy_database(path)
+        connections.databases[self.alias] = {
+            "ENGINE": "django.db.backends.sqlite3", "NAME": path}
+
+        def forget_replica():
+            connections[self.alias].close()
+            del connections[self.alias]
+            del connections.databases[self.alias]
+        self.addCleanup(forget_replica)
+
+    @override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+    def test_router_keeps_one_replica_per_request(self):
+        from yatube import routers
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), "default")
+        state, token = routers.start(use_replica=True)
+        try:
+            replica = router.db_for_read(Post)
+            self.assertIn(replica, ["replica1", "replica2"])
+            for _ in range(20):
+                self.assertEqual(router.db_for_read(Comment), replica)
+            self.assertEqual(router.db_for_write(Post), "default")
+            self.assertEqual(router.db_for_read(Post), "default")
+        finally:
+            routers.stop(token)
+        self.assertTrue(state.wrote)
+        self.assertFalse(router.allow_migrate("replica1", "posts"))
+
+    def test_reads_stick_to_primary_after_write(self):
+        url = reverse("post", args=[self.user.username, self.post.pk])
+        # Written after the copy: the replica has not caught up with it.
+        Comment.objects.create(post=self.post, author=self.user, text="Запоздавший ответ")
+        with override_settings(DATABASE_REPLICAS=[self.alias]):
+            response = self.client.get(url)
+            self.assertContains(response, "Пост на реплике")
+            self.assertNotContains(response, "Запоздавший ответ")
+            response = self.client.post(
+                reverse("add_comment", args=[self.user.username, self.post.pk]),
+                {"text": "Свой комментарий"})
+            self.assertIn("read_primary_until", response.cookies)
+            response = self.client.get(url)
+            self.assertContains(response, "Запоздавший ответ")
+            self.assertContains(response, "Свой комментарий")
+            self.client.cookies["read_primary_until"] = "0"
+            self.assertNotContains(self.client.get(url), "Свой комментарий")
+
+
+    def test_cached_pages_are_built_from_primary(self):
+        # Written after the copy: bumps the generation, the replica lags.
+        Post.objects.create(text="Свежий пост", author=self.user)
+        with override_settings(DATABASE_REPLICAS=[self.alias]):
+            self.assertContains(Client().get(reverse("index")), "Свежий пост")
+            self.assertContains(Client().get(reverse("index")), "Свежий пост")
+
+
+# The backup cannot read the primary while TestCase holds it in a transaction.
+class SyncReplicasTest(TransactionTestCase):
+    def test_copies_database(self):
+        import sqlite3
+        user = User.objects.create_user(username="replica_user", password="12345")
+        Post.objects.create(text="Пост на реплике", author=user)
+        from posts.management.commands.sync_replicas import copy_database
+        target = os.path.join(tempfile.mkdtemp(), "replica.sqlite3")
+        self.addCleanup(shutil.rmtree, os.path.dirname(target))
+        copy_database(target)
+        copy = sqlite3.connect(target)
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute("SELECT text FROM posts_post").fetchall(),
+                         [("Пост на реплике",)])
+        self.assertEqual(copy.execute("PRAGMA journal_mode").fetchone(), ("delete",))
+
+
+class ProductionDatabaseTest(TestCase):
+    @override_settings(SQLITE_PRAGMAS={"journal_mode": "WAL", "synchronous": "NORMAL",
+                                       "busy_timeout": 1234})
+    def test_pragmas_and_immediate_transactions(self):
+        import sqlite3
+        from yatube.db.base import DatabaseWrapper
+        path = os.path.join(tempfile.mkdtemp(), "db.sqlite3")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        database = DatabaseWrapper(dict(connection.settings_dict, NAME=path), "production")
+        self.addCleanup(database.close)
+        with database.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone(), ("wal",))
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone(), (1,))
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone(), (1234,))
+            cursor.execute("CREATE TABLE t (x)")
+        other = sqlite3.connect(path, timeout=0)
+        self.addCleanup(other.close)
+        database._start_transaction_under_autocommit()
+        # Nothing written yet, but the write lock is already held.
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute("INSERT INTO t VALUES (1)")
+        database.connection.execute("ROLLBACK")
+
+
+class CommentPagesTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="talker", password="12345")
+        self.post = Post.objects.create(text="Обсуждаемый пост", author=self.author)
+        readers = [User.objects.create_user(username=f"reader{n}") for n in range(5)]
+        for number in range(25):
+            Comment.objects.create(post=self.post, author=readers[number % 5],
+                                   text=f"Комментарий №{number}.")
+        self.url = reverse("post", args=["talker", self.post.pk])
+
+    def test_post_page_shows_first_comments_in_bulk(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertContains(response, "Комментарий №19.")
+        self.assertNotContains(response, "Комментарий №20.")
+        comment_queries = [q for q in queries if 'FROM "posts_comment"' in q["sql"]]
+        # One query for the page, authors joined in; none per comment.
+        self.assertEqual(len(comment_queries), 1)
+        self.assertIn("auth_user", comment_queries[0]["sql"])
+        self.assertLess(len(queries), 10)
+        self.assertIn(reverse("post_comments", args=["talker", self.post.pk]),
+                      response.content.decode())
+
+    def test_fragment_continues_after_cursor(self):
+        response = self.client.get(self.url)
+        cursor = response.context["next_cursor"]
+        response = self.client.get(
+            reverse("post_comments", args=["talker", self.post.pk]), {"cursor": cursor})
+        self.assertContains(response, "Комментарий №20.")
+        self.assertContains(response, "Комментарий №24.")
+        self.assertNotContains(response, "Комментарий №19.")
+        self.assertIsNone(response.context["next_cursor"])
+
+
+class HotPostsTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="hot_author")
+        self.fresh = Post.objects.create(text="Свежее обсуждение", author=self.author)
+        self.old = Post.objects.create(text="Старое обсуждение", author=self.author)
+
+    def test_comments_add_up_with_decay(self):
+        from django.utils import timezone
+        from . import hot
+        from .models import HotPost
+        Comment.objects.create(post=self.fresh, author=self.author, text="Раз")
+        Comment.objects.create(post=self.fresh, author=self.author, text="Два")
+        self.assertAlmostEqual(hot.heat(HotPost.objects.get(post=self.fresh).score), 2, places=3)
+        long_ago = timezone.now() - timezone.timedelta(days=1)
+        for _ in range(4):
+            hot.record_comment(self.old.pk, long_ago)
+        # Four comments four half-lives ago weigh a quarter of one now.
+        self.assertAlmostEqual(hot.heat(HotPost.objects.get(post=self.old).score), 0.25, places=3)
+
+    def test_popular_feed_is_ranked(self):
+        from django.utils import timezone
+        from . import hot
+        hot.record_comment(self.old.pk, timezone.now() - timezone.timedelta(hours=6))
+        hot.record_comment(self.fresh.pk, timezone.now())
+        Post.objects.create(text="Без комментариев", author=self.author)
+        response = self.client.get(reverse("popular"))
+        self.assertEqual([post.pk for post in response.context["page"]],
+                         [self.fresh.pk, self.old.pk])
+
+    @override_settings(HOT_POSTS_LIMIT=1)
+    def test_compact_drops_cold_posts_and_trims(self):
+        from django.utils import timezone
+        from . import hot
+        from .models import HotPost
+        third = Post.objects.create(text="Третий", author=self.author)
+        hot.record_comment(self.old.pk, timezone.now() - timezone.timedelta(days=3))
+        hot.record_comment(self.fresh.pk, timezone.now())
+        hot.record_comment(third.pk, timezone.now() - timezone.timedelta(hours=1))
+        self.assertEqual(hot.compact(), 2)
+        self.assertEqual(list(HotPost.objects.values_list("post", flat=True)), [self.fresh.pk])
+        out = StringIO()
+        call_command("update_hot_posts", "--rebuild", stdout=out)
+        self.assertIn("0 постов", out.getvalue())
+
+
+    @override_settings(HOT_POSTS_LIMIT=1)
+    def test_compact_keeps_one_of_tied_posts(self):
+        from django.utils import timezone
+        from . import hot
+        from .models import HotPost
+        now = timezone.now()
+        hot.record_comment(self.fresh.pk, now)
+        hot.record_comment(self.old.pk, now)
+        self.assertEqual(hot.compact(now), 1)
+        self.assertEqual(list(HotPost.objects.values_list("post", flat=True)),
+                         [max(self.fresh.pk, self.old.pk)])
+
+    def test_migration_fills_hot_posts(self):
+        import importlib
+        from django.apps import apps
+        from .models import HotPost
+        migration = importlib.import_module("posts.migrations.0015_hotpost")
+        Comment.objects.create(post=self.fresh, author=self.author, text="Ответ")
+        HotPost.objects.all().delete()
+        migration.fill_hot_posts(apps, None)
+        self.assertEqual(list(HotPost.objects.values_list("post", flat=True)), [self.fresh.pk])
+
+class GroupDirectoryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="dir_author")
+        self.groups = [Group.objects.create(title=f"Группа {n}", slug=f"dir-{n}",
+                                            description="Описание") for n in range(3)]
+        for number in range(6):
+            Post.objects.create(text=f"Пост {number}", author=self.author,
+                                group=self.groups[number % 2])
+
+    def test_directory_is_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("group_directory"))
+        rows = {row["slug"]: row for row in response.context["groups"]}
+        self.assertEqual(rows["dir-0"]["posts_count"], 3)
+        self.assertEqual(rows["dir-1"]["latest_post_text"], "Пост 5")
+        self.assertEqual(rows["dir-2"]["posts_count"], 0)
+        self.assertIsNone(rows["dir-2"]["last_activity"])
+        with self.assertNumQueries(0):
+            self.client.get(reverse("group_directory"))
+
+    def test_new_post_invalidates_directory(self):
+        self.client.get(reverse("group_directory"))
+        Post.objects.create(text="Первый пост группы", author=self.author, group=self.groups[2])
+        response = self.client.get(reverse("group_directory"))
+        self.assertContains(response, "Первый пост группы")
+        self.assertContains(response, reverse("group_posts", args=["dir-2"]))
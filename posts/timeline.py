@@ -0,0 +1,116 @@
+"""Materialised follow timeline.
+
+Every follower gets a ``TimelineEntry`` when an author publishes, so the
+follow feed is a range read over the follower's own inbox instead of a
+join of ``Follow`` against the whole ``Post`` table. Authors with more
+than ``TIMELINE_FANOUT_LIMIT`` followers are not fanned out; their posts
+are merged into the feed at read time instead. When such an author drops
+back to the limit, ``backfill_followers`` gives every follower the
+recent posts that were only merged until then.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+
+from .models import Follow, Post, TimelineEntry, UserStats
+
+FEED_KEYS = ('feed_date', 'feed_post')
+
+
+def is_fanout_author(author):
+    followers = UserStats.objects.filter(user=author).values_list('followers_count', flat=True)
+    return (followers.first() or 0) <= settings.TIMELINE_FANOUT_LIMIT
+
+
+def dropped_to_fanout(author_id):
+    """Whether an unfollow has just brought the author back to the limit."""
+    return UserStats.objects.filter(
+        user_id=author_id, followers_count=settings.TIMELINE_FANOUT_LIMIT).exists()
+
+
+def fan_out(post):
+    """Deliver a new post to the inbox of every follower of its author."""
+    if not is_fanout_author(post.author_id):
+        return
+    followers = Follow.objects.filter(author=post.author_id).values_list('user', flat=True)
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user, author):
+    """Copy an author's recent posts into a new follower's inbox."""
+    if not is_fanout_author(author):
+        return
+    posts = Post.objects.filter(author=author).order_by('-pub_date')
+    posts = posts.values_list('pk', 'pub_date')[:settings.TIMELINE_BACKFILL_LIMIT]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user.pk, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def backfill_followers(author_id):
+    """Copy an author's recent posts into the inbox of every follower."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'INSERT OR IGNORE INTO {} (user_id, post_id, pub_date)'
+            ' SELECT f.user_id, p.id, p.pub_date FROM {} f,'
+            ' (SELECT id, pub_date FROM {} WHERE author_id = %s'
+            '  ORDER BY pub_date DESC LIMIT %s) p'
+            ' WHERE f.author_id = %s'.format(
+                TimelineEntry._meta.db_table, Follow._meta.db_table, Post._meta.db_table),
+            [author_id, settings.TIMELINE_BACKFILL_LIMIT, author_id])
+
+
+def prune(user, author):
+    """Drop an unfollowed author's posts from the follower's inbox."""
+    TimelineEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def rebuild():
+    """Refill every inbox from scratch, e.g. after a bulk import.
+
+    Same shape as ``backfill`` for each follow: the newest posts of every
+    followed author that is not too popular to be fanned out. Relies on
+    ``UserStats`` being up to date.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM {}'.format(TimelineEntry._meta.db_table))
+        cursor.execute(
+            'INSERT INTO {} (user_id, post_id, pub_date)'
+            ' SELECT f.user_id, p.id, p.pub_date FROM {} f'
+            ' JOIN {} s ON s.user_id = f.author_id AND s.followers_count <= %s'
+            ' JOIN (SELECT id, author_id, pub_date, ROW_NUMBER() OVER ('
+            '   PARTITION BY author_id ORDER BY pub_date DESC) AS position'
+            '   FROM {}) p ON p.author_id = f.author_id AND p.position <= %s'.format(
+                TimelineEntry._meta.db_table, Follow._meta.db_table,
+                UserStats._meta.db_table, Post._meta.db_table),
+            [settings.TIMELINE_FANOUT_LIMIT, settings.TIMELINE_BACKFILL_LIMIT])
+
+
+def fanout_on_read_authors(user):
+    """Followed authors too popular to have been fanned out on write."""
+    return Follow.objects.filter(
+        user=user,
+        author__stats__followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).values('author')
+
+
+def follow_feed(user):
+    """Querysets making up ``user``'s follow feed, keyed by ``FEED_KEYS``."""
+    inbox = Post.objects.for_feed().filter(timeline_entries__user=user).annotate(
+        feed_date=F('timeline_entries__pub_date'),
+        feed_post=F('timeline_entries__post'),
+    )
+    popular = Post.objects.for_feed().filter(
+        author__in=fanout_on_read_authors(user)).annotate(
+        feed_date=F('pub_date'),
+        feed_post=F('pk'),
+    )
+    return [inbox, popular]
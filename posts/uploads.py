@@ -0,0 +1,102 @@
+"""Memory-bounded handling of image uploads.
+
+Every upload is streamed in chunks to a temporary file under
+``MEDIA_ROOT`` (``StreamingUploadHandler`` in ``FILE_UPLOAD_HANDLERS``),
+so the storage later moves it into place with a rename instead of
+copying it, and Django never holds a whole file in memory.
+
+The post upload views are wrapped in ``limit_uploads``, which swaps in
+``IMAGE_UPLOAD_HANDLERS``, that is ``LimitedUploadHandler``: a file that
+grows past
+``IMAGE_UPLOAD_MAX_BYTES`` is dropped as soon as the limit is crossed
+and replaced by an ``OversizedUpload`` marker that ``PostForm`` turns
+into a form error. Other forms, such as the admin's, never see the
+marker.
+
+``normalize_image`` runs after the form has checked the pixel count
+against ``IMAGE_UPLOAD_MAX_PIXELS``, so decoding is bounded too. It
+applies the EXIF orientation and drops the EXIF block in one decode and
+one encode, writing the result over the uploaded file; images without
+EXIF are kept byte for byte.
+"""
+import os
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler, load_handler
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image, ImageOps
+
+
+class OversizedUpload(UploadedFile):
+    """Stands in for a file that went over the byte limit."""
+
+    def __init__(self, name, size):
+        super().__init__(None, name, size=size)
+
+
+class StreamingUploadHandler(TemporaryFileUploadHandler):
+    def new_file(self, *args, **kwargs):
+        os.makedirs(settings.FILE_UPLOAD_TEMP_DIR, exist_ok=True)
+        super().new_file(*args, **kwargs)
+
+
+class LimitedUploadHandler(StreamingUploadHandler):
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.oversized = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.oversized:
+            return None
+        if self.received > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.oversized = True
+            self.file.close()
+            return None
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.oversized:
+            return OversizedUpload(self.file_name, self.received)
+        return super().file_complete(file_size)
+
+
+def limit_uploads(view):
+    """Apply ``IMAGE_UPLOAD_HANDLERS`` to the uploads of ``view``.
+
+    Handlers must be replaced before the body is read, and the CSRF
+    middleware reads it first, so the CSRF check moves inside.
+    """
+    protected = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_handlers = [
+            load_handler(handler, request) for handler in settings.IMAGE_UPLOAD_HANDLERS]
+        return protected(request, *args, **kwargs)
+    return wrapper
+
+
+def normalize_image(upload):
+    """Rewrite ``upload`` upright and without EXIF, in place."""
+    upload.seek(0)
+    with Image.open(upload) as image:
+        if not image.getexif():
+            upload.seek(0)
+            return upload
+        image_format = 'JPEG' if image.format == 'MPO' else image.format
+        # Decodes the whole image, so the file can be overwritten below.
+        upright = ImageOps.exif_transpose(image)
+    options = {'quality': 90} if image_format == 'JPEG' else {}
+    upload.seek(0)
+    upload.truncate()
+    # No ``exif=`` here: encoders only write EXIF they are handed.
+    upright.save(upload, image_format, **options)
+    upload.size = upload.tell()
+    upload.seek(0)
+    return upload
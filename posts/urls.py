@@ -1,14 +1,23 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("", views.index, name="index"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("popular/", views.popular, name="popular"),
+    path("group/", views.group_directory, name="group_directory"),
     path("group/<slug:slug>/", views.group_posts, name="group_posts"),
     path("new/", views.new_post, name="new_post"),
+    path("search/", views.search, name="search"),
+    path("api/v1/posts/", api.index, name="api_index"),
+    path("api/v1/follow/", api.follow_index, name="api_follow_index"),
+    path("api/v1/group/<slug:slug>/", api.group_posts, name="api_group_posts"),
+    path("api/v1/u/<str:username>/", api.profile, name="api_profile"),
+    path("api/v1/u/<str:username>/<int:post_id>/", api.post_view, name="api_post"),
     path("<str:username>/", views.profile, name="profile"),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
     path("<username>/<int:post_id>/comment", views.add_comment, name="add_comment"),
+    path("<str:username>/<int:post_id>/comments/", views.post_comments, name="post_comments"),
     path(
             '<str:username>/<int:post_id>/edit/', 
             views.post_edit, 
@@ -16,4 +25,5 @@ urlpatterns = [
         ),
     path("<str:username>/follow/", views.profile_follow, name="profile_follow"), 
     path("<str:username>/unfollow/", views.profile_unfollow, name="profile_unfollow"),
+    path("<str:username>/export/", views.export_posts, name="export_posts"),
     ]
\ No newline at end of file
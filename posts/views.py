@@ -1,18 +1,129 @@
+import hashlib
+from datetime import datetime
+
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import HttpResponseForbidden, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
-from .models import Post, Group, User, Comment, Follow
+from .models import Post, Group, User, Comment, Follow, UserStats
 from . forms import PostForm, CommentForm
 from django.urls import reverse
-from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.views.decorators.http import condition
+from django.conf import settings
+from .cache import cache_page_versioned, get_or_build
+from .uploads import limit_uploads
+from .paginator import NEXT, CursorPaginator, decode_cursor, encode_cursor, newer_than
+from . import counters, export, images, search as post_search, timeline
+
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+
+
+def paginate(request, post_list, keys=('pub_date', 'pk')):
+    page = CursorPaginator(post_list, POSTS_PER_PAGE, keys).get_page(
+        request.GET.get('cursor'))
+    return page, page.paginator
+
+
+def comment_page(post, cursor=None):
+    """A page of ``post``'s comments, oldest first, and the next cursor.
+
+    The first page is a plain queryset: the post's comment counter tells
+    whether there are more. Later pages, loaded by ``post_comments``,
+    fetch one extra row to find out.
+    """
+    comments = post.comments.select_related('author').order_by('created', 'pk')
+    position = decode_cursor(cursor) if cursor else None
+    if position is None or not isinstance(position[1], datetime):
+        comments = comments[:COMMENTS_PER_PAGE]
+        more = post.comment_count > COMMENTS_PER_PAGE
+    else:
+        _, created, pk = position
+        rows = list(comments.filter(newer_than(('created', 'pk'), created, pk))[
+            :COMMENTS_PER_PAGE + 1])
+        comments, more = rows[:COMMENTS_PER_PAGE], len(rows) > COMMENTS_PER_PAGE
+    last = list(comments)[-1] if more and comments else None
+    next_cursor = encode_cursor(NEXT, last.created, last.pk) if last else None
+    return comments, next_cursor
+
+
+# Validators for conditional GETs. Each one reads only the handful of
+# columns the page depends on, so a repeat visit is answered with a 304
+# before the view runs. The viewer is part of every ETag: the navigation
+# bar, edit links and follow buttons depend on who is looking. So is the
+# CSRF cookie, which the forms on the page are signed with.
+
+def make_etag(request, *parts):
+    viewer = request.user.pk if request.user.is_authenticated else None
+    csrf = request.META.get('CSRF_COOKIE')
+    return hashlib.md5(repr((viewer, csrf) + parts).encode()).hexdigest()
+
+
+def page_state(request, post_list):
+    """What the cards on the requested page show that can change."""
+    rows = post_list.only('pk', 'pub_date', 'updated', 'comment_count')
+    page = CursorPaginator(rows, POSTS_PER_PAGE).get_page(request.GET.get('cursor'))
+    return [(post.pk, post.updated, post.comment_count) for post in page]
+
+
+def stats_state(user_id):
+    return UserStats.objects.filter(user_id=user_id).values_list(
+        'posts_count', 'followers_count', 'following_count').first()
+
+
+def group_etag(request, slug):
+    group = Group.objects.filter(slug=slug).values_list(
+        'pk', 'title', 'description').first()
+    if group is None:
+        return None
+    return make_etag(request, group, page_state(
+        request, Post.objects.filter(group_id=group[0])))
+
+
+def profile_etag(request, username):
+    user_id = User.objects.filter(username=username).values_list('pk', flat=True).first()
+    if user_id is None:
+        return None
+    following = (request.user.is_authenticated and Follow.objects.filter(
+        user=request.user, author_id=user_id).exists())
+    return make_etag(request, user_id, stats_state(user_id), following, page_state(
+        request, Post.objects.filter(author_id=user_id)))
+
+
+def post_state(request, username, post_id):
+    # Shared by the ETag and Last-Modified functions of one request.
+    if not hasattr(request, '_post_state'):
+        request._post_state = Post.objects.filter(
+            pk=post_id, author__username=username,
+        ).order_by().values_list(
+            'updated', 'comment_count', 'author_id',
+        ).annotate(last_comment=Max('comments__created')).first()
+    return request._post_state
+
+
+def post_etag(request, username, post_id):
+    state = post_state(request, username, post_id)
+    if state is None:
+        return None
+    return make_etag(request, state, stats_state(state[2]))
+
 
+def post_last_modified(request, username, post_id):
+    # Only anonymous pages: a client that sends If-Modified-Since without
+    # If-None-Match must not get a 304 after logging in or out.
+    state = post_state(request, username, post_id)
+    if state is None or request.user.is_authenticated:
+        return None
+    updated, _, _, last_comment = state
+    return max(updated, last_comment) if last_comment else updated
 
-@cache_page(20, key_prefix='index_page')
+
+@cache_page_versioned(settings.INDEX_CACHE_TIMEOUT, key_prefix='index_page')
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed()
+    page, paginator = paginate(request, post_list)
     return render(
             request,
             'index.html',
@@ -20,12 +131,52 @@ def index(request):
        )
 
 
+def popular(request):
+    # The join starts from the score index of the small hot-post table.
+    post_list = Post.objects.for_feed().filter(hot__isnull=False).annotate(
+        hot_score=F('hot__score'), hot_post=F('hot__post'))
+    page, paginator = paginate(request, post_list, keys=('hot_score', 'hot_post'))
+    return render(
+            request,
+            'popular.html',
+            {'page': page, 'paginator': paginator}
+       )
+
+
+def group_directory_rows():
+    """Every group with its post count, last activity and latest post.
+
+    One query and no GROUP BY: each figure is a correlated subquery over
+    the group feed index, which counts the group's entries or reads its
+    newest one.
+    """
+    posts = Post.objects.filter(group=OuterRef('pk'))
+    latest = posts.order_by('-pub_date', '-pk')
+    count = posts.order_by().values('group').annotate(total=Count('pk')).values('total')
+    return list(Group.objects.order_by('title').annotate(
+        posts_count=Coalesce(Subquery(count, output_field=IntegerField()), 0),
+        last_activity=Subquery(latest.values('pub_date')[:1]),
+        latest_post_id=Subquery(latest.values('pk')[:1]),
+        latest_post_text=Subquery(latest.values('text')[:1]),
+        latest_post_author=Subquery(latest.values('author__username')[:1]),
+    ).values(
+        'slug', 'title', 'description', 'posts_count', 'last_activity',
+        'latest_post_id', 'latest_post_text', 'latest_post_author',
+    ))
+
+
+def group_directory(request):
+    # Cached per content generation, so a new post shows up at once.
+    groups = get_or_build(
+        'group_directory', group_directory_rows, settings.GROUP_DIRECTORY_CACHE_TIMEOUT)
+    return render(request, 'groups.html', {'groups': groups})
+
+
+@condition(etag_func=group_etag)
 def group_posts(request, slug):
     groups = get_object_or_404(Group, slug=slug)
-    post_list = groups.group_posts.all()[:12]
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = groups.group_posts.for_feed()
+    page, paginator = paginate(request, post_list)
     return render(
         request, "group.html", {
         "group": groups, 
@@ -34,7 +185,20 @@ def group_posts(request, slug):
         })
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    post_list = post_search.rank_posts(Post.objects.for_feed(), query)
+    page, paginator = paginate(request, post_list, post_search.KEYS)
+    return render(request, 'search.html', {
+        'query': query,
+        'page': page,
+        'paginator': paginator,
+    })
+
+
+@limit_uploads
 @login_required()
+@transaction.atomic
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if not form.is_valid():
@@ -42,44 +206,60 @@ def new_post(request):
     post = form.save(commit=False)
     post.author = request.user
     post.save()
+    images.schedule(post)
     return redirect("index")
 
 
+@condition(etag_func=profile_etag)
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    posts_list = user.author_posts.all()
-    all_posts_count = user.author_posts.count()
+    posts_list = user.author_posts.for_feed()
+    stats = counters.stats_for(user)
     if request.user.is_authenticated:
         following = Follow.objects.filter(user=request.user, author=user).exists()
     else:
         following = False
-    paginator  = Paginator(posts_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    page, paginator = paginate(request, posts_list)
     return render(request, 'profile.html', {
             'profile': user, 
             'page': page, 
             'paginator': paginator, 
             'post_list': posts_list, 
-            'all_posts_count': all_posts_count,
+            'all_posts_count': stats.posts_count,
+            'stats': stats,
             'following': following
             })
 
 
+@condition(etag_func=post_etag, last_modified_func=post_last_modified)
 def post_view(request, username, post_id):
     form = CommentForm()
-    post = get_object_or_404(Post, pk=post_id, author__username=username) 
-    all_posts_count = post.author.author_posts.count()
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.for_feed(), pk=post_id, author__username=username)
+    stats = counters.stats_for(post.author)
+    comments, next_cursor = comment_page(post)
     return render(request, "post.html", {
             'post': post, 
             'profile': post.author, 
-            'all_posts_count': all_posts_count,
+            'all_posts_count': stats.posts_count,
+            'stats': stats,
             'comments': comments,
+            'next_cursor': next_cursor,
             'form': form,
             })
 
 
+@condition(etag_func=post_etag)
+def post_comments(request, username, post_id):
+    """The comments after ``?cursor=``, as a fragment for the post page."""
+    post = get_object_or_404(
+        Post.objects.select_related('author'), pk=post_id, author__username=username)
+    comments, next_cursor = comment_page(post, request.GET.get('cursor'))
+    return render(request, "includes/comment_list.html", {
+        'post': post, 'items': comments, 'next_cursor': next_cursor})
+
+
+@limit_uploads
 @login_required
 def post_edit(request, username, post_id):
     post = get_object_or_404(Post, pk=post_id, author__username=username)
@@ -87,24 +267,33 @@ def post_edit(request, username, post_id):
         return redirect('post', username=username, post_id=post_id)
     form = PostForm(request.POST or None, files=request.FILES or None, instance=post)
     if form.is_valid():
-        form.save()
+        post = form.save(commit=False)
+        if 'image' in form.changed_data:
+            post.image_variants = ''
+        post.save()
+        if 'image' in form.changed_data:
+            images.schedule(post)
         return redirect("post", username=request.user.username, post_id=post_id)
     return render(
         request, 'post_edit.html', {'form': form, 'post': post},
     )
 
 @login_required
+@transaction.atomic
 def add_comment(request, username, post_id):
     form = CommentForm(request.POST or None)
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
-    all_posts_count = post.author.author_posts.count()
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.for_feed(), pk=post_id, author__username=username)
+    stats = counters.stats_for(post.author)
     if not form.is_valid():
+        comments, next_cursor = comment_page(post)
         return render(request, "post.html", {
             'post': post,
             'profile': post.author,
-            'all_posts_count': all_posts_count,
+            'all_posts_count': stats.posts_count,
+            'stats': stats,
             'comments': comments,
+            'next_cursor': next_cursor,
             'form': form,
             })
     comment = form.save(commit=False)
@@ -130,10 +319,8 @@ def server_error(request):
 
 @login_required  
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    posts = timeline.follow_feed(request.user)
+    page, paginator = paginate(request, posts, timeline.FEED_KEYS)
     return render(
         request,
         "follow.html",
@@ -142,6 +329,7 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
@@ -150,7 +338,25 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.get(user=request.user, author=author).delete()
-    return redirect("profile", username=username)
\ No newline at end of file
+    return redirect("profile", username=username)
+
+
+@login_required
+def export_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    if request.user != author:
+        return HttpResponseForbidden()
+    export_format = request.GET.get('format', 'jsonl')
+    if export_format not in export.FORMATS:
+        export_format = 'jsonl'
+    response = StreamingHttpResponse(
+        export.lines(author, export_format),
+        content_type=export.FORMATS[export_format],
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{author.username}.{export_format}"')
+    return response
@@ -1,4 +1,12 @@
+import pytest
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(autouse=True)
+def inline_thumbnails(settings):
+    # A job left on the thread pool would outlive the test's database.
+    settings.IMAGE_WORKERS = 0
@@ -0,0 +1,187 @@
+"""
+ASGI config for yatube project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+e.g. ``uvicorn yatube.asgi:application``.
+
+Django 2.2 has no ASGI handler and cannot run ``async def`` views (both
+arrived in later releases), so ``application`` adapts the regular WSGI
+handler instead. The event loop owns the connection: it receives the
+request body and sends the response to the client at whatever pace the
+client reads. Django itself, ORM included, runs in a bounded thread pool
+and hands the finished response over a small queue. A worker thread is
+therefore busy only while a view runs, never while a slow client uploads
+or downloads, which is what used to tie up WSGI workers.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+
+# Response chunks the view thread may run ahead of the client.
+RESPONSE_BUFFER = 8
+
+
+class WsgiToAsgi:
+    def __init__(self, wsgi_application, workers):
+        self.wsgi_application = wsgi_application
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def http(self, scope, receive, send):
+        # Bodies up to FILE_UPLOAD_MAX_MEMORY_SIZE stay in memory, larger
+        # ones are spooled to disk, none past max_body_size().
+        limit = max_body_size()
+        if content_length(scope) > limit:
+            await reject(send)
+            return
+        body = tempfile.SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        received = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            chunk = message.get('body', b'')
+            received += len(chunk)
+            if received > limit:
+                body.close()
+                await reject(send)
+                return
+            body.write(chunk)
+            more_body = message.get('more_body', False)
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(RESPONSE_BUFFER)
+        worker = loop.run_in_executor(
+            self.executor, self.run_wsgi, environ(scope, body), loop, queue)
+        error = None
+        while True:
+            message = await queue.get()
+            if message is None:
+                break
+            if error is None:
+                try:
+                    await send(message)
+                except Exception as exc:
+                    # Client gone: keep draining so the thread can finish.
+                    error = exc
+        await worker
+        body.close()
+        if error is not None:
+            raise error
+
+    def run_wsgi(self, environ, loop, queue):
+        """Run Django in a worker thread, feeding messages to ``queue``."""
+        def put(message):
+            asyncio.run_coroutine_threadsafe(queue.put(message), loop).result()
+
+        started = []
+
+        def start_response(status, headers, exc_info=None):
+            started[:] = [{
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                            for name, value in headers],
+            }]
+
+        try:
+            response = self.wsgi_application(environ, start_response)
+            try:
+                put(started[0])
+                for chunk in response:
+                    if chunk:
+                        put({'type': 'http.response.body', 'body': chunk,
+                             'more_body': True})
+            finally:
+                # Fires request_finished, which closes the thread's DB
+                # connection if it is past CONN_MAX_AGE.
+                if hasattr(response, 'close'):
+                    response.close()
+            put({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            put(None)
+
+
+def max_body_size():
+    """The largest body a view accepts: an image plus the other fields."""
+    return settings.IMAGE_UPLOAD_MAX_BYTES + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+
+
+def content_length(scope):
+    for name, value in scope.get('headers', []):
+        if name.lower() == b'content-length':
+            try:
+                return int(value)
+            except ValueError:
+                break
+    return 0
+
+
+async def reject(send):
+    """Answer 413 without reading the rest of the body."""
+    await send({'type': 'http.response.start', 'status': 413,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8'),
+                            (b'connection', b'close')]})
+    await send({'type': 'http.response.body', 'body': b'Request body too large'})
+
+
+def environ(scope, body):
+    """Build a PEP 3333 environ from an ASGI HTTP scope."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    result = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f'HTTP_{name}'
+        result[name] = f'{result[name]},{value}' if name in result else value
+    return result
+
+
+application = WsgiToAsgi(get_wsgi_application(), settings.ASGI_WORKERS)
@@ -0,0 +1,24 @@
+"""SQLite database backend for the production profile.
+
+``ENGINE = 'yatube.db'`` is Django's SQLite backend with two changes.
+
+SQLite keeps most settings per connection, so ``SQLITE_PRAGMAS`` is
+applied each time a connection is opened:
+
+* ``journal_mode=WAL`` lets readers run alongside the single writer
+  instead of being locked out by it;
+* ``busy_timeout`` makes a writer wait for the lock rather than fail
+  with "database is locked";
+* ``synchronous=NORMAL`` syncs the WAL at checkpoints rather than on
+  every commit: a power cut may lose the last commits, never integrity;
+* ``mmap_size``, ``cache_size`` and ``temp_store`` keep hot pages and
+  sorting in memory.
+
+Transactions start with ``BEGIN IMMEDIATE``, which takes the write lock
+up front. With a plain ``BEGIN`` a transaction that reads before it
+writes, like the ``atomic`` ``add_comment`` view, fails at once with
+"database is locked" if another connection holds the write lock by the
+time it writes: SQLite cannot let it wait, since the snapshot it has
+read from may be outdated. An immediate transaction waits for the lock
+like any other write.
+"""
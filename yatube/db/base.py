@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        pragmas = dict(settings.SQLITE_PRAGMAS)
+        if self.alias in settings.DATABASE_REPLICAS:
+            # Replicas are rollback-journal copies that sync_replicas swaps
+            # out whole; a WAL file left next to one would corrupt the next.
+            pragmas.pop('journal_mode', None)
+        for name, value in pragmas.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
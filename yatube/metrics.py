@@ -0,0 +1,70 @@
+"""Per-request performance counters.
+
+``RequestMetricsMiddleware`` opens a recorder for a sampled request; code
+that wants to report something (the page and card caches, the template
+backend below) calls ``incr`` or ``add_time`` and the values land in the
+recorder of the request being served. Outside a sampled request both
+calls do nothing, so they are safe to leave in hot paths.
+"""
+import time
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates, Template
+
+_recorder = ContextVar('request_metrics', default=None)
+
+
+class Recorder:
+    def __init__(self):
+        self.counters = {}
+        self.timings = {}
+        self.template_depth = 0
+
+
+def start():
+    recorder = Recorder()
+    return recorder, _recorder.set(recorder)
+
+
+def stop(token):
+    _recorder.reset(token)
+
+
+def incr(name, value=1):
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.counters[name] = recorder.counters.get(name, 0) + value
+
+
+def add_time(name, seconds):
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.timings[name] = recorder.timings.get(name, 0) + seconds
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        recorder = _recorder.get()
+        if recorder is None:
+            return super().render(context, request)
+        # Cards are rendered from inside the page template; only the
+        # outermost render is timed so nothing is counted twice.
+        recorder.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            recorder.template_depth -= 1
+            if not recorder.template_depth:
+                add_time('template', time.perf_counter() - start)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Django template backend that reports render time to the recorder."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
@@ -0,0 +1,125 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics, routers
+
+logger = logging.getLogger('yatube.requests')
+
+
+class QueryTimer:
+    """``execute_wrapper`` that counts queries and their total duration."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - start
+
+
+class RequestMetricsMiddleware:
+    """Measure queries, DB time, cache hits and template time per request.
+
+    A share of requests set by ``METRICS_SAMPLE_RATE`` is instrumented and
+    gets a ``Server-Timing`` header plus a log line on ``yatube.requests``.
+    Every request is timed, and one slower than ``METRICS_SLOW_REQUEST_MS``
+    is logged as a warning even when it was not sampled.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= settings.METRICS_SAMPLE_RATE:
+            start = time.perf_counter()
+            response = self.get_response(request)
+            total = time.perf_counter() - start
+            if total * 1000 >= settings.METRICS_SLOW_REQUEST_MS:
+                self.log(request, response, {'total_ms': ms(total)})
+            return response
+
+        timer = QueryTimer()
+        recorder, token = metrics.start()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                response = self.get_response(request)
+        finally:
+            total = time.perf_counter() - start
+            metrics.stop(token)
+
+        fields = {
+            'total_ms': ms(total),
+            'queries': timer.queries,
+            'db_ms': ms(timer.seconds),
+            'template_ms': ms(recorder.timings.get('template', 0)),
+            'cache_hits': recorder.counters.get('cache_hits', 0),
+            'cache_misses': recorder.counters.get('cache_misses', 0),
+        }
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={fields["db_ms"]};desc="{timer.queries} queries"',
+            f'tpl;dur={fields["template_ms"]}',
+            f'cache;desc="{fields["cache_hits"]} hits, {fields["cache_misses"]} misses"',
+            f'total;dur={fields["total_ms"]}',
+        ])
+        self.log(request, response, fields)
+        return response
+
+    def log(self, request, response, fields):
+        fields = {
+            'method': request.method,
+            'path': request.path,
+            'view': getattr(request.resolver_match, 'view_name', None),
+            'status': response.status_code,
+            **fields,
+        }
+        slow = fields['total_ms'] >= settings.METRICS_SLOW_REQUEST_MS
+        logger.log(logging.WARNING if slow else logging.INFO,
+                   json.dumps(fields), extra={'metrics': fields})
+
+
+class ReplicaMiddleware:
+    """Send the reads of safe requests to the replicas, see ``routers``.
+
+    A request that writes sets ``REPLICA_PIN_COOKIE`` holding the time
+    until which the visitor's reads stay on the primary.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        now = time.time()
+        try:
+            pinned = float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE, 0)) > now
+        except ValueError:
+            pinned = False
+        state, token = routers.start(
+            request.method in ('GET', 'HEAD') and not pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.stop(token)
+        if state.wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, str(int(now + settings.REPLICA_PIN_SECONDS)),
+                max_age=settings.REPLICA_PIN_SECONDS, httponly=True,
+                samesite='Lax')
+        return response
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
@@ -0,0 +1,80 @@
+"""Read replicas with read-your-writes stickiness.
+
+Reads of a GET or HEAD request go to one alias from
+``DATABASE_REPLICAS``, picked at random when the request starts, so a
+page never mixes rows from replicas that lag by different amounts.
+Writes, and every read outside a request (management commands, the
+thumbnail workers), go to ``default``.
+
+A replica lags behind the primary, so whoever has just written must not
+read from it for a while. Once a request writes, through a POST or a
+GET such as ``profile_follow``, its remaining reads stay on the primary,
+and ``ReplicaMiddleware`` sets a cookie that keeps the visitor's reads
+on the primary for ``REPLICA_PIN_SECONDS``. Other visitors keep reading
+from the replicas.
+
+Whatever is cached under the current content generation is built inside
+``primary()``: a page built from a replica that has not caught up yet
+would otherwise be served as current until the next generation.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = 'default'
+_state = ContextVar('replica_state', default=None)
+
+
+class State:
+    def __init__(self, use_replica):
+        self.replica = (random.choice(settings.DATABASE_REPLICAS)
+                        if use_replica and settings.DATABASE_REPLICAS else None)
+        self.wrote = False
+
+
+def start(use_replica):
+    state = State(use_replica)
+    return state, _state.set(state)
+
+
+def stop(token):
+    _state.reset(token)
+
+
+@contextmanager
+def primary():
+    """Send the reads of the block to the primary."""
+    outer = _state.get()
+    state, token = start(use_replica=False)
+    try:
+        yield state
+    finally:
+        stop(token)
+        if state.wrote and outer is not None:
+            outer.wrote = True
+            outer.replica = None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.replica is None:
+            return PRIMARY
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.replica = None
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas are copies of the primary, so any pair of rows may relate.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema with the data, see ``sync_replicas``.
+        return db not in settings.DATABASE_REPLICAS
@@ -52,6 +52,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.middleware.RequestMetricsMiddleware',
+    'yatube.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,7 +69,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'yatube.metrics.TimedDjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -84,6 +86,10 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
+# Потоки, в которых yatube/asgi.py выполняет Django; соединение
+# с клиентом при этом обслуживает цикл событий
+ASGI_WORKERS = 16
+
 
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
@@ -95,6 +101,43 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения (см. yatube/routers.py): YATUBE_DB_REPLICAS=N
+# добавляет N копий базы. Здесь это локальные файлы SQLite, которые
+# обновляет manage.py sync_replicas; в тестах реплики смотрят в основную базу
+DATABASE_REPLICAS = []
+for number in range(1, int(os.environ.get('YATUBE_DB_REPLICAS', 0)) + 1):
+    DATABASE_REPLICAS.append(f'replica{number}')
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, f'db.replica{number}.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['yatube.routers.ReplicaRouter']
+
+# Профиль базы (см. yatube/db): YATUBE_DB_PROFILE=production включает
+# журнал WAL, ожидание блокировки вместо ошибки «database is locked»
+# и постоянные соединения; в разработке у SQLite настройки по умолчанию
+DATABASE_PROFILE = os.environ.get('YATUBE_DB_PROFILE', 'development')
+SQLITE_PRAGMAS = {}
+if DATABASE_PROFILE == 'production':
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 2 ** 20,
+        'cache_size': -20000,
+        'temp_store': 'MEMORY',
+    }
+    for database in DATABASES.values():
+        database['ENGINE'] = 'yatube.db'
+        database['CONN_MAX_AGE'] = 60
+        # То же ожидание блокировки, но уже при открытии соединения
+        database['OPTIONS'] = {'timeout': 5}
+# После записи чтения посетителя столько секунд идут в основную базу,
+# чтобы он видел свои изменения, пока реплики их догоняют
+REPLICA_PIN_SECONDS = 15
+REPLICA_PIN_COOKIE = 'read_primary_until'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -148,9 +191,97 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
+# Кэш по умолчанию живёт в памяти процесса. YATUBE_CACHE=sqlite включает
+# общий для всех процессов кэш в файле SQLite (см. yatube/sqlite_cache.py):
+# страницы прогреваются один раз на всех, а смена поколения сразу видна везде
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sqlite': {
+        'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache.sqlite3')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+            'MAX_BYTES': 256 * 2 ** 20,
+        },
+    },
+}
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        **CACHE_BACKENDS[os.environ.get('YATUBE_CACHE', 'locmem')],
         'KEY_PREFIX': 'index_page',
     }
-}
\ No newline at end of file
+}
+# Лента подписок: авторы с большим числом подписчиков
+# не раскладываются по лентам при публикации, а подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# Сколько последних постов автора попадает в ленту при подписке
+TIMELINE_BACKFILL_LIMIT = 500
+
+# Популярные посты (см. posts/hot.py): вес комментария вдвое падает
+# за HOT_HALF_LIFE секунд; manage.py update_hot_posts убирает остывшие
+# посты и оставляет не больше HOT_POSTS_LIMIT самых обсуждаемых
+HOT_HALF_LIFE = 6 * 60 * 60
+HOT_MIN_SCORE = 0.05
+HOT_POSTS_LIMIT = 1000
+
+# Сколько живёт закэшированная карточка поста (ключ меняется при правке)
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Главная страница кэшируется до любого изменения постов, комментариев
+# или групп; таймаут лишь ограничивает время жизни записи в кэше.
+# LocMemCache у каждого процесса свой: правка, сделанная в другом процессе,
+# его поколение не меняет, поэтому там запись живёт прежние 20 секунд
+CACHE_IS_SHARED = CACHES['default']['BACKEND'] != CACHE_BACKENDS['locmem']['BACKEND']
+INDEX_CACHE_TIMEOUT = 60 * 60 if CACHE_IS_SHARED else 20
+# Пока одна копия процесса пересобирает страницу, остальные отдают
+# прежнюю: устаревшая запись хранится ещё столько секунд после таймаута.
+# Блокировка пересборки живёт не дольше CACHE_LOCK_TIMEOUT (если процесс
+# упал); столько же ждут её снятия, когда отдать пока нечего
+CACHE_STALE_TIMEOUT = 60
+CACHE_LOCK_TIMEOUT = 10
+# Попадания и промахи кэша копятся в процессе и раз в столько секунд
+# добавляются к общим счётчикам (manage.py cache_stats)
+CACHE_STATS_FLUSH_INTERVAL = 10
+
+# Каталог групп тоже кэшируется до любого изменения постов или групп
+GROUP_DIRECTORY_CACHE_TIMEOUT = 60 * 60 if CACHE_IS_SHARED else 20
+
+# Сколько потоков готовят миниатюры загруженных картинок;
+# 0 — готовить сразу после сохранения поста, в том же процессе
+IMAGE_WORKERS = 2
+
+# Загрузки пишутся потоком во временный файл внутри MEDIA_ROOT,
+# откуда хранилище переносит их на место без копирования
+FILE_UPLOAD_HANDLERS = ['posts.uploads.StreamingUploadHandler']
+FILE_UPLOAD_TEMP_DIR = os.path.join(MEDIA_ROOT, 'tmp')
+# Загрузки картинок к постам вдобавок обрываются на IMAGE_UPLOAD_MAX_BYTES
+IMAGE_UPLOAD_HANDLERS = ['posts.uploads.LimitedUploadHandler']
+# Предельный размер картинки в байтах и в точках (защита от «бомб»,
+# которые при распаковке занимают гигабайты памяти)
+IMAGE_UPLOAD_MAX_BYTES = 10 * 2 ** 20
+IMAGE_UPLOAD_MAX_PIXELS = 40 * 10 ** 6
+
+# Метрики запросов (см. yatube/middleware.py): доля запросов, для которых
+# считаются запросы к БД, кэш и шаблоны, и порог, после которого
+# запрос попадает в лог как медленный
+METRICS_SAMPLE_RATE = 0.01
+METRICS_SLOW_REQUEST_MS = 500
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'yatube.requests': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
@@ -0,0 +1,282 @@
+"""Cache backend shared by every process on the host, stored in SQLite.
+
+``LocMemCache`` keeps a separate cache in every worker process. Each
+worker then warms its own copy of every page, a generation bump made in
+one process is invisible to the others, and the hit and miss counters in
+``posts/cache.py`` only ever see one process. This backend keeps the
+entries in a single SQLite file in WAL mode instead: readers never block
+each other or the writer, and a write is a short transaction without an
+fsync.
+
+* **Size bound.** ``MAX_ENTRIES`` (as in Django's own backends) and
+  ``MAX_BYTES`` cap the number and the total size of the stored values.
+  Triggers keep both totals in a one-row table, so checking them after a
+  write costs one lookup rather than a scan.
+* **LRU eviction.** Past either bound, expired entries go first, then the
+  least recently read ones, ``1 / CULL_FREQUENCY`` of the cache at a
+  time. The read time is refreshed at most once per
+  ``ACCESS_RESOLUTION`` seconds per entry, so a hot key does not turn
+  every read into a write.
+* **Atomic increments.** Integers are stored as SQLite integers rather
+  than pickles, and ``incr`` adds to them with a single ``UPDATE``, so
+  concurrent increments from different processes are never lost.
+
+Usage::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+            'LOCATION': '/var/cache/yatube/cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000, 'MAX_BYTES': 256 * 2 ** 20},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Seconds the read time of an entry may lag behind; see the module docstring.
+ACCESS_RESOLUTION = 1.0
+# Keys per statement, well below SQLite's limit on bound parameters.
+BATCH_SIZE = 500
+INT_RANGE = range(-2 ** 63, 2 ** 63)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed);
+CREATE INDEX IF NOT EXISTS cache_entries_expires ON cache_entries (expires);
+CREATE TABLE IF NOT EXISTS cache_usage (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    entries INTEGER NOT NULL,
+    bytes INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_usage VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_entries_insert AFTER INSERT ON cache_entries
+BEGIN
+    UPDATE cache_usage SET entries = entries + 1, bytes = bytes + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_delete AFTER DELETE ON cache_entries
+BEGIN
+    UPDATE cache_usage SET entries = entries - 1, bytes = bytes - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_update AFTER UPDATE OF size ON cache_entries
+BEGIN
+    UPDATE cache_usage SET bytes = bytes + NEW.size - OLD.size;
+END;
+"""
+
+UPSERT = """
+INSERT INTO cache_entries (key, value, size, expires, accessed)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET
+    value = excluded.value, size = excluded.size,
+    expires = excluded.expires, accessed = excluded.accessed
+"""
+LIVE = '(expires IS NULL OR expires > ?)'
+
+
+def encode(value):
+    if type(value) is int and value in INT_RANGE:
+        return value, 8
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    return data, len(data)
+
+
+def decode(value):
+    return value if isinstance(value, int) else pickle.loads(value)
+
+
+def batches(keys):
+    keys = list(keys)
+    for start in range(0, len(keys), BATCH_SIZE):
+        yield keys[start:start + BATCH_SIZE]
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_bytes = int(options.get('MAX_BYTES', 64 * 2 ** 20))
+        self.busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    # Connections are per thread and per process: a forked worker must
+    # not share the parent's file handle.
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.location, timeout=self.busy_timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        # Take the write lock up front so a read-then-write cannot deadlock.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _expires(self, timeout):
+        # None means "never"; 0 stores an entry that is already expired.
+        return self.get_backend_timeout(timeout)
+
+    def _touch_stale(self, connection, rows, now):
+        stale = [key for key, accessed in rows if accessed < now - ACCESS_RESOLUTION]
+        if stale:
+            connection.executemany(
+                'UPDATE cache_entries SET accessed = ? WHERE key = ?',
+                [(now, key) for key in stale])
+
+    def _cull(self, connection, now):
+        entries, size = connection.execute(
+            'SELECT entries, bytes FROM cache_usage').fetchone()
+        if entries <= self._max_entries and size <= self.max_bytes:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache_entries')
+            return
+        connection.execute('DELETE FROM cache_entries WHERE expires <= ?', (now,))
+        while True:
+            entries, size = connection.execute(
+                'SELECT entries, bytes FROM cache_usage').fetchone()
+            if entries <= self._max_entries and size <= self.max_bytes or not entries:
+                return
+            connection.execute(
+                'DELETE FROM cache_entries WHERE key IN ('
+                'SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)',
+                (max(1, entries // self._cull_frequency),))
+
+    def _set(self, connection, rows, now):
+        connection.executemany(UPSERT, rows)
+        self._cull(connection, now)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        data, size = encode(value)
+        now = time.time()
+        with self._transaction() as connection:
+            if connection.execute(
+                    f'SELECT 1 FROM cache_entries WHERE key = ? AND {LIVE}',
+                    (key, now)).fetchone():
+                return False
+            self._set(connection, [(key, data, size, self._expires(timeout), now)], now)
+        return True
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            f'SELECT value, accessed FROM cache_entries WHERE key = ? AND {LIVE}',
+            (key, now)).fetchone()
+        if row is None:
+            return default
+        self._touch_stale(connection, [(key, row[1])], now)
+        return decode(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        now = time.time()
+        connection = self._connection()
+        result, accessed = {}, []
+        for batch in batches(keys):
+            placeholders = ', '.join('?' * len(batch))
+            for key, value, last in connection.execute(
+                    f'SELECT key, value, accessed FROM cache_entries '
+                    f'WHERE key IN ({placeholders}) AND {LIVE}', (*batch, now)):
+                result[keys[key]] = decode(value)
+                accessed.append((key, last))
+        self._touch_stale(connection, accessed, now)
+        return result
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        data, size = encode(value)
+        now = time.time()
+        with self._transaction() as connection:
+            self._set(connection, [(key, data, size, self._expires(timeout), now)], now)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self._expires(timeout)
+        rows = [(self._key(key, version), *encode(value), expires, now)
+                for key, value in data.items()]
+        with self._transaction() as connection:
+            self._set(connection, rows, now)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        cursor = self._connection().execute(
+            f'UPDATE cache_entries SET expires = ?, accessed = ? WHERE key = ? AND {LIVE}',
+            (self._expires(timeout), now, key, now))
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        made_key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            updated = connection.execute(
+                f'UPDATE cache_entries SET value = value + ?, accessed = ? '
+                f"WHERE key = ? AND typeof(value) = 'integer' AND {LIVE}",
+                (delta, now, made_key, now)).rowcount
+            if updated:
+                return connection.execute(
+                    'SELECT value FROM cache_entries WHERE key = ?',
+                    (made_key,)).fetchone()[0]
+        # Missing (ValueError) or not a plain integer: the generic,
+        # non-atomic read-modify-write.
+        return super().incr(key, delta, version)
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._connection().execute(
+            f'SELECT 1 FROM cache_entries WHERE key = ? AND {LIVE}',
+            (key, time.time())).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        cursor = self._connection().execute(
+            'DELETE FROM cache_entries WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            for batch in batches(keys):
+                connection.execute(
+                    f"DELETE FROM cache_entries WHERE key IN ({', '.join('?' * len(batch))})",
+                    batch)
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache_entries')